@@ -0,0 +1,196 @@
+import os
+import gzip
+import shutil
+import threading
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from loguru import logger
+from output_writer import write_atomic
+
+
+# 预压缩的编码及其文件后缀
+SIDECAR_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+# 需要预压缩的文本资源
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.svg', '.json', '.map', '.txt', '.xml'}
+
+
+def resolve_encodings(precompress):
+    """把 precompress 参数转换为编码元组：True 表示 gzip 和 br，也可以是 'gzip'、'br' 或列表"""
+    if not precompress:
+        return ()
+    if precompress is True:
+        return tuple(SIDECAR_SUFFIXES)
+    if isinstance(precompress, str):
+        precompress = [item.strip() for item in precompress.split(',')]
+    encodings = tuple(dict.fromkeys(precompress))
+    unknown = set(encodings) - set(SIDECAR_SUFFIXES)
+    if unknown:
+        raise ValueError(f"未知的预压缩编码: {', '.join(sorted(unknown))}")
+    return encodings
+
+
+class Precompressor:
+    """为目录中的文本资源写出预压缩的 .gz / .br 文件，供服务器直接发送
+
+    - 压缩文件的修改时间与源文件一致，再次运行时修改时间相同的压缩文件视为最新，直接跳过；
+    - 指向同一份内容的多个硬链接只压缩一次，其余文件名的压缩文件链接到第一次的结果；
+    - 压缩后没有变小或源文件小于 min_size 的不写压缩文件，源文件已不存在的压缩文件会被删除；
+    - 文件在 workers 个线程中并行压缩，metrics 不为空时计入 compress 阶段。
+    """
+
+    def __init__(self, encodings=('gzip', 'br'), workers=4, min_size=256, gzip_level=9, brotli_quality=11,
+                 metrics=None):
+        self.encodings = resolve_encodings(encodings)
+        self.workers = max(1, int(workers or 1))
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # 已压缩过的内容 {(st_dev, st_ino, encoding): Future}，结果为压缩文件路径，未写出时为None
+        self._inodes = {}
+        self.stats = {
+            'files': 0, 'up_to_date': 0, 'skipped': 0, 'linked': 0, 'removed': 0,
+            'gz_written': 0, 'br_written': 0, 'bytes_in': 0, 'bytes_gz': 0, 'bytes_br': 0
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def compress(self, content, encoding):
+        if encoding == 'gzip':
+            # mtime=0 使相同内容的输出完全一致
+            return gzip.compress(content, compresslevel=self.gzip_level, mtime=0)
+        import brotli
+        return brotli.compress(content, mode=brotli.MODE_TEXT, quality=self.brotli_quality)
+
+    def sidecar_path(self, path, encoding):
+        return path.with_name(path.name + SIDECAR_SUFFIXES[encoding])
+
+    def _is_up_to_date(self, sidecar, stat):
+        try:
+            return sidecar.stat().st_mtime_ns == stat.st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def _remove(self, sidecar):
+        try:
+            sidecar.unlink()
+            self._count('removed')
+        except FileNotFoundError:
+            pass
+
+    def _write_sidecar(self, sidecar, data, stat):
+        write_atomic(sidecar, lambda f: f.write(data))
+        # 修改时间与源文件一致，用于判断压缩文件是否最新
+        os.utime(sidecar, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    def _link_sidecar(self, existing, sidecar):
+        """让同一份内容的另一个文件名共享已写出的压缩文件"""
+        tmp_path = sidecar.with_name(f'.{sidecar.name}.tmp')
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        try:
+            os.link(existing, tmp_path)
+        except OSError:
+            shutil.copy2(existing, tmp_path)
+        os.replace(tmp_path, sidecar)
+
+    def _process_file(self, path, content_cache):
+        stat = path.stat()
+        if stat.st_size < self.min_size:
+            for encoding in self.encodings:
+                self._remove(self.sidecar_path(path, encoding))
+            self._count('skipped')
+            return
+        for encoding in self.encodings:
+            sidecar = self.sidecar_path(path, encoding)
+            if self._is_up_to_date(sidecar, stat):
+                self._count('up_to_date')
+                continue
+            key = (stat.st_dev, stat.st_ino, encoding)
+            with self._lock:
+                first = self._inodes.get(key)
+                if first is None:
+                    future = self._inodes[key] = Future()
+            if first is not None:
+                # 其他文件名已为这份内容压缩过，等待其结果
+                existing = first.result()
+                if existing is None:
+                    self._remove(sidecar)
+                elif existing != sidecar:
+                    self._link_sidecar(existing, sidecar)
+                    self._count('linked')
+                continue
+
+            try:
+                future.set_result(self._compress_file(path, sidecar, encoding, stat, content_cache))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+
+    def _compress_file(self, path, sidecar, encoding, stat, content_cache):
+        """压缩并写出一个压缩文件，返回其路径，压缩没有收益时返回None"""
+        if content_cache.get('content') is None:
+            with open(path, 'rb') as f:
+                content_cache['content'] = f.read()
+            self._count('bytes_in', len(content_cache['content']))
+        content = content_cache['content']
+        data = self.compress(content, encoding)
+        if len(data) >= len(content):
+            # 不写压缩文件，服务器会直接发送源文件
+            self._remove(sidecar)
+            return None
+        self._write_sidecar(sidecar, data, stat)
+        suffix = SIDECAR_SUFFIXES[encoding][1:]
+        self._count(f'{suffix}_written')
+        self._count(f'bytes_{suffix}', len(data))
+        return sidecar
+
+    def _process(self, path):
+        content_cache = {}
+        if self.metrics is None:
+            return self._process_file(path, content_cache)
+        with self.metrics.phase('compress'):
+            return self._process_file(path, content_cache)
+
+    def find_files(self, root):
+        """返回需要压缩的文件，并删除源文件已不存在的压缩文件"""
+        files = []
+        suffixes = set(SIDECAR_SUFFIXES.values())
+        for dirpath, dirnames, filenames in os.walk(root):
+            names = set(filenames)
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                base, ext = os.path.splitext(filename)
+                if ext in suffixes:
+                    if base not in names and os.path.splitext(base)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                        self._remove(path)
+                    continue
+                if filename.startswith('.') or ext.lower() not in COMPRESSIBLE_EXTENSIONS:
+                    continue
+                files.append(path)
+        return sorted(files)
+
+    def run(self, root):
+        """压缩 root 下的文本资源，返回统计信息"""
+        if not self.encodings:
+            return self.get_stats()
+        files = self.find_files(root)
+        self._count('files', len(files))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='compress') as executor:
+            for future in [executor.submit(self._process, path) for path in files]:
+                future.result()
+        stats = self.get_stats()
+        logger.info(
+            f"预压缩 {stats['files']} 个文件：写出 gzip {stats['gz_written']} 个、brotli {stats['br_written']} 个，"
+            f"已是最新 {stats['up_to_date']} 个"
+        )
+        return stats
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['encodings'] = list(self.encodings)
+        return stats
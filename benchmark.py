@@ -0,0 +1,540 @@
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import random
+import hashlib
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.server
+import urllib.parse
+from pathlib import Path
+from datetime import datetime
+import brotli
+from loguru import logger
+
+
+RESULT_VERSION = 1
+REPO_DIR = Path(__file__).resolve().parent
+
+# 启动时间测试的目标：名称 -> 在仓库目录中用当前解释器运行的参数
+STARTUP_TARGETS = {
+    'gui_import': ['-c', 'import localize_gui'],
+    'gui_window': ['localize_gui.py', '--startup-probe'],
+    'localizer_import': ['-c', 'import localize_resources'],
+    'cli_help': ['localize_batch.py', '--help']
+}
+# 单次启动的超时秒数
+STARTUP_TIMEOUT = 120
+
+# 需要按 Accept-Encoding 压缩的文本类型
+COMPRESSIBLE_TYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+BINARY_TYPES = {'.woff2': 'font/woff2', '.ttf': 'font/ttf', '.png': 'image/png'}
+
+def generate_site(root, pages=50, shared_css=3, unique_css=True, shared_js=2, unique_js=True,
+                  fonts=4, images=8, import_depth=2, data_urls=2, text_size=4096, local_files=10, seed=0):
+    """生成合成站点，返回 (站点目录, CDN目录)
+
+    CDN 目录中是样式表、脚本、字体和图片；共享样式表带有 import_depth 层的 @import 链，
+    并通过 url() 引用字体、图片和 data URL。页面清单记录在 pages.json 中，
+    由 write_pages 在知道服务地址后写出页面。
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    site_dir = root / 'site'
+    cdn_dir = root / 'cdn'
+    shutil.rmtree(root, ignore_errors=True)
+    for path in (site_dir, cdn_dir / 'lib' / 'fonts', cdn_dir / 'lib' / 'img', cdn_dir / 'pages'):
+        path.mkdir(parents=True, exist_ok=True)
+
+    def filler(size):
+        words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+        text = []
+        length = 0
+        while length < size:
+            word = rng.choice(words)
+            text.append(word)
+            length += len(word) + 1
+        return ' '.join(text)
+
+    def css_rules(count):
+        rules = []
+        for i in range(count):
+            rules.append(f'.c{rng.randrange(10 ** 6)} {{ margin: {i}px; padding: {rng.randrange(20)}px; }}')
+        return '\n'.join(rules)
+
+    for i in range(fonts):
+        (cdn_dir / 'lib' / 'fonts' / f'font{i}.woff2').write_bytes(rng.randbytes(16 * 1024 + i))
+        (cdn_dir / 'lib' / 'fonts' / f'font{i}.ttf').write_bytes(rng.randbytes(32 * 1024 + i))
+    for i in range(images):
+        (cdn_dir / 'lib' / 'img' / f'img{i}.png').write_bytes(b'\x89PNG\r\n\x1a\n' + rng.randbytes(8 * 1024 + i))
+    data_url = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+
+    def asset_rules(index):
+        rules = []
+        if fonts:
+            font = index % fonts
+            rules.append(
+                f"@font-face {{ font-family: f{index}; src: url('fonts/font{font}.woff2') format('woff2'), "
+                f"url(fonts/font{font}.ttf) format('truetype'); }}"
+            )
+        for j in range(min(images, 3)):
+            rules.append(f'.bg{index}_{j} {{ background: url("img/img{(index + j) % images}.png"); }}')
+        for j in range(data_urls):
+            rules.append(f'.d{index}_{j} {{ background: url({data_url}); }}')
+        return '\n'.join(rules)
+
+    for i in range(shared_css):
+        # @import 链：shared{i}.css -> chain{i}_1.css -> ... -> chain{i}_{depth}.css
+        names = [f'shared{i}.css'] + [f'chain{i}_{k}.css' for k in range(1, import_depth + 1)]
+        for k, name in enumerate(names):
+            imports = f'@import "{names[k + 1]}";\n' if k + 1 < len(names) else ''
+            (cdn_dir / 'lib' / name).write_text(imports + asset_rules(i + k) + '\n' + css_rules(40), encoding='utf-8')
+    for i in range(shared_js):
+        (cdn_dir / 'lib' / f'shared{i}.js').write_text(f'/* shared {i} */\n' + f'var s{i} = "{filler(text_size)}";\n', encoding='utf-8')
+
+    pages_spec = []
+    for n in range(pages):
+        css = [f'lib/shared{i}.css' for i in range(shared_css)]
+        js = [f'lib/shared{i}.js' for i in range(shared_js)]
+        if unique_css:
+            (cdn_dir / 'pages' / f'page{n}.css').write_text(
+                '@import "../lib/shared0.css";\n' * bool(shared_css) + css_rules(10), encoding='utf-8'
+            )
+            css.append(f'pages/page{n}.css')
+        if unique_js:
+            (cdn_dir / 'pages' / f'page{n}.js').write_text(f'var p{n} = "{filler(512)}";\n', encoding='utf-8')
+            js.append(f'pages/page{n}.js')
+        # 第一个页面用 <img> 和不带类型的 <source> 引用同一张图片，同一URL按两种类型保存
+        body_images = [f'lib/img/img{n % images}.png'] if images and n == 0 else []
+        pages_spec.append((f'section{n % 10}/page{n}.html', css, js, filler(text_size), body_images))
+
+    for i in range(local_files):
+        local = site_dir / 'assets' / f'local{i}.bin'
+        local.parent.mkdir(parents=True, exist_ok=True)
+        local.write_bytes(rng.randbytes(64 * 1024))
+    (root / 'pages.json').write_text(json.dumps(pages_spec), encoding='utf-8')
+    return site_dir, cdn_dir
+
+
+def write_pages(root, base_url):
+    """按 generate_site 记录的页面写出HTML，引用指向 base_url"""
+    root = Path(root)
+    for path, css, js, text, body_images in json.loads((root / 'pages.json').read_text(encoding='utf-8')):
+        head = ''.join(f'<link rel="stylesheet" href="{base_url}/{href}">\n' for href in css)
+        head += ''.join(f'<script src="{base_url}/{src}"></script>\n' for src in js)
+        images = ''.join(
+            f'<img src="{base_url}/{src}">\n<video><source src="{base_url}/{src}"></video>\n' for src in body_images
+        )
+        page = root / 'site' / path
+        page.parent.mkdir(parents=True, exist_ok=True)
+        page.write_text(
+            f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n{head}</head>\n'
+            f'<body>\n<h1>{path}</h1>\n<p>{text}</p>\n{images}</body>\n</html>\n',
+            encoding='utf-8'
+        )
+
+
+class _CdnHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和内容一起写出，避免 Nagle 算法和延迟确认造成的额外等待
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cdn = self.server.cdn
+        path = urllib.parse.urlsplit(self.path).path.lstrip('/')
+        if cdn.latency:
+            time.sleep(cdn.latency)
+        if cdn.should_fail(path):
+            cdn.record('failures')
+            self._send(503, b'injected failure', {'Content-Type': 'text/plain'})
+            return
+
+        entry = cdn.load(path)
+        if entry is None:
+            cdn.record('not_found')
+            self._send(404, b'not found', {'Content-Type': 'text/plain'})
+            return
+        content, content_type, etag = entry
+        if self.headers.get('If-None-Match') == etag:
+            cdn.record('not_modified')
+            self._send(304, b'', {'ETag': etag})
+            return
+
+        headers = {'Content-Type': content_type, 'ETag': etag}
+        encoding = cdn.choose_encoding(path, self.headers.get('Accept-Encoding', ''))
+        if encoding:
+            content = cdn.encode(path, content, encoding)
+            headers['Content-Encoding'] = encoding
+        self._send(200, content, headers)
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+        self.server.cdn.record('requests')
+        self.server.cdn.record('bytes_sent', len(body))
+
+
+class CdnServer:
+    """本地的CDN替身
+
+    latency 为每个请求的延迟秒数；encoding 为 gzip / br 时按 Accept-Encoding 压缩样式表和脚本；
+    failure_rate 为注入 503 失败的比例，是否失败由 (seed, 路径, 第几次请求) 决定，多次运行结果相同。
+    """
+
+    def __init__(self, root, latency=0.0, encoding=None, failure_rate=0.0, seed=0):
+        self.root = Path(root)
+        self.latency = latency
+        self.encoding = encoding
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._files = {}
+        self._encoded = {}
+        self._attempts = {}
+        self.stats = {'requests': 0, 'bytes_sent': 0, 'failures': 0, 'not_modified': 0, 'not_found': 0}
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _CdnHandler)
+        self._server.daemon_threads = True
+        self._server.cdn = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def record(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def should_fail(self, path):
+        if not self.failure_rate:
+            return False
+        with self._lock:
+            attempt = self._attempts.get(path, 0)
+            self._attempts[path] = attempt + 1
+        digest = hashlib.sha256(f'{self.seed}:{path}:{attempt}'.encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], 'big') / 2 ** 32 < self.failure_rate
+
+    def load(self, path):
+        """读取文件，返回 (内容, Content-Type, ETag)，不存在时返回None"""
+        with self._lock:
+            if path in self._files:
+                return self._files[path]
+        file_path = (self.root / path).resolve()
+        if self.root.resolve() not in file_path.parents or not file_path.is_file():
+            return None
+        content = file_path.read_bytes()
+        suffix = file_path.suffix.lower()
+        content_type = COMPRESSIBLE_TYPES.get(suffix) or BINARY_TYPES.get(suffix) or 'application/octet-stream'
+        entry = (content, content_type, '"' + hashlib.sha256(content).hexdigest()[:16] + '"')
+        with self._lock:
+            self._files[path] = entry
+        return entry
+
+    def choose_encoding(self, path, accept_encoding):
+        if not self.encoding or Path(path).suffix.lower() not in COMPRESSIBLE_TYPES:
+            return None
+        accepted = {item.split(';')[0].strip() for item in accept_encoding.split(',')}
+        return self.encoding if self.encoding in accepted else None
+
+    def encode(self, path, content, encoding):
+        key = (path, encoding)
+        with self._lock:
+            if key in self._encoded:
+                return self._encoded[key]
+        encoded = gzip.compress(content, mtime=0) if encoding == 'gzip' else brotli.compress(content)
+        with self._lock:
+            self._encoded[key] = encoded
+        return encoded
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+            self._attempts.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _output_summary(output_dir):
+    files = 0
+    size = 0
+    for path in Path(output_dir).rglob('*'):
+        relative = path.relative_to(output_dir)
+        if relative.parts[0] in ('.blobs', '.tmp') or not path.is_file():
+            continue
+        files += 1
+        size += path.stat().st_size
+    return {'files': files, 'bytes': size}
+
+
+def run_once(site_dir, output_dir, server, localizer_options):
+    """运行一次完整的本地化，返回本次的计时和统计"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    server.reset_stats()
+    from localize_resources import ResourceLocalizer
+    start = time.perf_counter()
+    localizer = ResourceLocalizer(site_dir, output_dir=output_dir, **localizer_options)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    localizer.process_directory()
+    total = time.perf_counter() - start
+    report = localizer.get_run_report()
+    return {
+        'seconds': round(total, 6),
+        'setup_seconds': round(setup, 6),
+        'phases': report['metrics']['phases'],
+        'counters': report['metrics']['counters'],
+        'connections': {key: report['connections'][key] for key in ('requests', 'connections', 'reused')},
+        'cache': report.get('cache'),
+        'content_store': report.get('content_store'),
+        'server': server.get_stats(),
+        'output': _output_summary(output_dir)
+    }
+
+
+def summarize(runs):
+    """计算总时间和各阶段时间的最小值、中位数和平均值"""
+    def stats(values):
+        return {
+            'min': round(min(values), 6),
+            'median': round(statistics.median(values), 6),
+            'mean': round(statistics.fmean(values), 6),
+            'stdev': round(statistics.stdev(values), 6) if len(values) > 1 else 0.0
+        }
+    summary = {'seconds': stats([run['seconds'] for run in runs]), 'phases': {}}
+    names = sorted({name for run in runs for name in run['phases']})
+    for name in names:
+        summary['phases'][name] = stats([run['phases'].get(name, {}).get('seconds', 0.0) for run in runs])
+    return summary
+
+
+def compare(baseline, current):
+    """比较两次结果的中位数，返回 {指标: {baseline, current, change}}，change 为相对变化比例"""
+    def entry(old, new):
+        return {'baseline': old, 'current': new, 'change': round((new - old) / old, 4) if old else None}
+    result = {'total': entry(baseline['summary']['seconds']['median'], current['summary']['seconds']['median'])}
+    for name, stats in current['summary']['phases'].items():
+        old = baseline['summary']['phases'].get(name)
+        if old:
+            result[name] = entry(old['median'], stats['median'])
+    return result
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def time_command(command, env=None):
+    """运行一次命令，返回耗时秒数，命令失败时抛出 RuntimeError"""
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               timeout=STARTUP_TIMEOUT)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        lines = completed.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"退出码 {completed.returncode}")
+    return elapsed
+
+
+def run_startup_once(commands):
+    """测量一轮启动时间，返回与 run_once 相同结构的结果，各目标的冷、热启动时间记为阶段
+
+    冷启动使用新建的空字节码缓存目录（PYTHONPYCACHEPREFIX），所有模块都要重新编译；
+    热启动紧接着使用同一目录再运行一次。操作系统的文件缓存无法清空，两者都包含在内。
+    """
+    phases = {}
+    for name, command in commands.items():
+        with tempfile.TemporaryDirectory(prefix='localize_pycache_') as pycache:
+            env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache)
+            # 不写字节码时热启动与冷启动没有区别
+            env.pop('PYTHONDONTWRITEBYTECODE', None)
+            phases[f'{name}_cold'] = {'seconds': round(time_command(command, env), 6)}
+            phases[f'{name}_warm'] = {'seconds': round(time_command(command, env), 6)}
+    warm = sum(phase['seconds'] for name, phase in phases.items() if name.endswith('_warm'))
+    return {'seconds': round(warm, 6), 'phases': phases}
+
+
+def run_startup_benchmark(args):
+    """测量图形界面和命令行的启动时间，无法运行的目标（如没有显示器时的窗口）会被跳过"""
+    names = args.startup_target or list(STARTUP_TARGETS)
+    commands = {name: [sys.executable, *STARTUP_TARGETS[name]] for name in names}
+    if args.startup_exe:
+        # 打包后的程序，冷启动与热启动只区别于是否第一次运行
+        commands['exe'] = [str(Path(args.startup_exe).resolve()), '--startup-probe']
+
+    skipped = {}
+    for name, command in list(commands.items()):
+        try:
+            time_command(command)
+        except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"跳过启动目标 {name}: {e}")
+            skipped[name] = str(e)
+            del commands[name]
+    if not commands:
+        raise SystemExit('没有可以运行的启动目标')
+
+    runs = []
+    for i in range(args.warmup + args.repeat):
+        run = run_startup_once(commands)
+        if i >= args.warmup:
+            runs.append(run)
+            logger.info(f"第 {len(runs)} 轮启动: 热启动合计 {run['seconds']:.3f}s")
+
+    return {
+        'version': RESULT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'config': {
+            'startup': {'targets': commands, 'skipped': skipped},
+            'repeat': args.repeat, 'warmup': args.warmup
+        },
+        'runs': runs,
+        'summary': summarize(runs)
+    }
+
+
+def run_benchmark(args):
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix='localize_bench_'))
+    site_options = {
+        'pages': args.pages, 'shared_css': args.shared_css, 'unique_css': not args.no_unique_css,
+        'shared_js': args.shared_js, 'unique_js': not args.no_unique_js, 'fonts': args.fonts,
+        'images': args.images, 'import_depth': args.import_depth, 'data_urls': args.data_urls,
+        'text_size': args.text_size, 'local_files': args.local_files, 'seed': args.seed
+    }
+    server_options = {
+        'latency': args.latency, 'encoding': args.encoding, 'failure_rate': args.failure_rate, 'seed': args.seed
+    }
+    localizer_options = {
+        'max_workers': args.workers, 'html_processes': args.html_processes, 'mirror_mode': args.mirror_mode,
+        'cache_dir': args.cache_dir
+    }
+
+    site_dir, cdn_dir = generate_site(work_dir, **site_options)
+    runs = []
+    try:
+        with CdnServer(cdn_dir, **server_options) as server:
+            write_pages(work_dir, server.base_url)
+            for i in range(args.warmup + args.repeat):
+                run = run_once(site_dir, work_dir / 'output', server, localizer_options)
+                if i >= args.warmup:
+                    runs.append(run)
+                    logger.info(f"第 {len(runs)} 次运行: {run['seconds']:.3f}s")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'version': RESULT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'config': {
+            'site': site_options, 'server': server_options,
+            'localizer': localizer_options, 'repeat': args.repeat, 'warmup': args.warmup
+        },
+        'runs': runs,
+        'summary': summarize(runs)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='ResourceLocalizer 基准测试')
+    site = parser.add_argument_group('合成站点')
+    site.add_argument('--pages', type=int, default=50)
+    site.add_argument('--shared-css', type=int, default=3)
+    site.add_argument('--no-unique-css', action='store_true', help='页面不引用各自独有的样式表')
+    site.add_argument('--shared-js', type=int, default=2)
+    site.add_argument('--no-unique-js', action='store_true', help='页面不引用各自独有的脚本')
+    site.add_argument('--fonts', type=int, default=4)
+    site.add_argument('--images', type=int, default=8)
+    site.add_argument('--import-depth', type=int, default=2, help='共享样式表的 @import 链长度')
+    site.add_argument('--data-urls', type=int, default=2, help='每个样式表中的 data URL 数')
+    site.add_argument('--text-size', type=int, default=4096, help='每个页面的正文字节数')
+    site.add_argument('--local-files', type=int, default=10, help='站点中需要镜像的非HTML文件数')
+    site.add_argument('--seed', type=int, default=0)
+
+    server = parser.add_argument_group('CDN 替身')
+    server.add_argument('--latency', type=float, default=0.0, help='每个请求的延迟秒数')
+    server.add_argument('--encoding', choices=['gzip', 'br'], default=None)
+    server.add_argument('--failure-rate', type=float, default=0.0, help='注入 503 失败的比例')
+
+    run = parser.add_argument_group('运行')
+    run.add_argument('--workers', type=int, default=8)
+    run.add_argument('--html-processes', type=int, default=0)
+    run.add_argument('--mirror-mode', default='copy')
+    run.add_argument('--cache-dir', default=None, help='持久化缓存目录，多次运行共用')
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--warmup', type=int, default=0)
+    run.add_argument('--work-dir', default=None, help='生成站点和输出的目录，默认使用临时目录')
+    run.add_argument('--keep', action='store_true', help='保留生成的站点和输出')
+    run.add_argument('--output', default=None, help='结果JSON文件，默认输出到标准输出')
+    run.add_argument('--compare', default=None, help='与之前的结果JSON比较')
+    run.add_argument('--log-level', default='WARNING')
+
+    startup = parser.add_argument_group('启动时间')
+    startup.add_argument('--startup', action='store_true', help='测量图形界面和命令行的冷、热启动时间，不运行本地化')
+    startup.add_argument('--startup-target', action='append', choices=list(STARTUP_TARGETS), default=None,
+                         help='只测量指定的目标，可以多次指定')
+    startup.add_argument('--startup-exe', default=None, help='同时测量打包后的程序（以 --startup-probe 运行）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    result = run_startup_benchmark(args) if args.startup else run_benchmark(args)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            result['comparison'] = compare(json.load(f), result)
+        for name, item in result['comparison'].items():
+            change = f"{item['change']:+.1%}" if item['change'] is not None else '-'
+            print(f"{name:<24} {item['baseline']:>10.4f}s -> {item['current']:>10.4f}s  {change}", file=sys.stderr)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,27 @@
 import PyInstaller.__main__
 import os
+import argparse
+
+parser = argparse.ArgumentParser(description='打包资源本地化工具')
+parser.add_argument('--onedir', action='store_true',
+                    help='打包为目录而不是单个文件：启动时不必先解压到临时目录，启动更快')
+args = parser.parse_args()
 
 # 确保图标文件存在
 if not os.path.exists('favicon.ico'):
     raise FileNotFoundError("找不到 favicon.ico 文件，请确保它在当前目录中")
 
+if args.onedir:
+    # 目录模式下文件直接从安装目录加载，不用 UPX 压缩，省去每次启动时的解压
+    mode_options = ['--onedir', '--noupx']
+else:
+    # 单文件模式每次启动都会先把程序解压到临时目录
+    mode_options = ['--onefile']
+
 PyInstaller.__main__.run([
     'localize_gui.py',
     '--name=资源本地化工具',
-    '--onefile',
+    *mode_options,
     '--windowed',
     '--icon=favicon.ico',
     '--add-data=favicon.ico;.',
@@ -16,11 +29,14 @@ PyInstaller.__main__.run([
     '--hidden-import=tkinter',
     '--hidden-import=tkinter.ttk',
     '--hidden-import=loguru',
+    # 以下模块在开始本地化或页面需要时才导入
+    '--hidden-import=localize_resources',
     '--hidden-import=beautifulsoup4',
+    '--hidden-import=bs4',
     '--hidden-import=chardet',
     '--hidden-import=brotli',
     '--clean',
     '--noconfirm',
     # 添加日志等级环境变量
     '--add-binary=favicon.ico;.'
-]) 
\ No newline at end of file
+])
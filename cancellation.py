@@ -0,0 +1,113 @@
+import time
+import threading
+from contextlib import contextmanager
+from loguru import logger
+
+
+# 取消的原因
+CANCELLED = 'cancelled'
+DEADLINE = 'deadline'
+
+
+class Cancelled(Exception):
+    """运行被取消或超过了整体截止时间，reason 为 cancelled 或 deadline"""
+
+    def __init__(self, reason=CANCELLED):
+        super().__init__('运行已超过截止时间' if reason == DEADLINE else '运行已被取消')
+        self.reason = reason
+
+
+class AssetTimeout(TimeoutError):
+    """单个资源的下载（包括重试）超过了截止时间，只有该资源失败，运行继续；与其他超时一样计入主机的失败次数"""
+
+
+class CancelToken:
+    """一次运行的协作式取消令牌
+
+    cancel() 可以在任意线程中调用：之后 check() 抛出 Cancelled，sleep() 立即返回并抛出 Cancelled，
+    通过 on_cancel() 登记的回调（如中断正在进行的HTTP传输）在调用 cancel() 的线程中执行一次。
+    set_deadline() 设置整体截止时间，到期时以 deadline 为原因自动取消。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._callbacks = {}
+        self._next_id = 0
+        self._timer = None
+        self.deadline = None
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=CANCELLED):
+        """取消运行，重复调用时只有第一次生效"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"取消回调出错: {str(e)}")
+
+    def set_deadline(self, seconds):
+        """从现在起 seconds 秒后自动取消，None 表示不限时"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if seconds is None:
+                self.deadline = None
+                return
+            self.deadline = time.monotonic() + seconds
+            self._timer = threading.Timer(seconds, self.cancel, args=(DEADLINE,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def remaining(self):
+        """距整体截止时间的秒数，没有截止时间时返回None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds):
+        """等待 seconds 秒，期间被取消时立即抛出 Cancelled"""
+        if seconds > 0:
+            self._event.wait(seconds)
+        self.check()
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """在代码块执行期间登记取消回调，已取消时直接抛出 Cancelled"""
+        with self._lock:
+            if self._event.is_set():
+                raise Cancelled(self.reason)
+            key = self._next_id
+            self._next_id += 1
+            self._callbacks[key] = callback
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(key, None)
+
+    def close(self):
+        """停止截止时间的计时器"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
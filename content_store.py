@@ -0,0 +1,123 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from loguru import logger
+
+
+class ContentStore:
+    """输出目录中按 sha256 保存内容的存储
+
+    相同内容只写入一次，对外的文件名通过硬链接指向同一份内容；
+    文件系统不支持硬链接时改为复制。
+    """
+
+    def __init__(self, root, fsync=False):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._link_supported = True
+        self._digests = set()
+        # 正在写入的内容 {digest: Event}，同一内容的其他写入等待它完成后再链接
+        self._writing = {}
+        self.stats = {'blobs': 0, 'bytes_stored': 0, 'bytes_deduplicated': 0, 'links': 0, 'copies': 0}
+
+    def blob_path(self, digest):
+        return self.root / digest[:2] / digest
+
+    def _claim(self, digest, size):
+        """登记一份内容，已存在时等待其写入完成并返回False，需要写入时返回写完后要通知的 Event"""
+        with self._lock:
+            if digest in self._digests or self.blob_path(digest).exists():
+                self.stats['bytes_deduplicated'] += size
+                writing = self._writing.get(digest)
+            else:
+                self._digests.add(digest)
+                self.stats['blobs'] += 1
+                self.stats['bytes_stored'] += size
+                writing = self._writing[digest] = threading.Event()
+                return writing
+        if writing is not None:
+            writing.wait()
+        return False
+
+    def _release(self, digest, writing, stored):
+        """写入结束后通知等待的线程，写入失败时取消登记，之后可以重新写入"""
+        with self._lock:
+            del self._writing[digest]
+            if not stored:
+                self._digests.discard(digest)
+        writing.set()
+
+    def put_bytes(self, digest, content):
+        """保存内容，返回内容文件路径；内容在锁外写入，不同内容可以同时写入"""
+        blob_path = self.blob_path(digest)
+        writing = self._claim(digest, len(content))
+        if writing:
+            stored = False
+            try:
+                blob_path.parent.mkdir(exist_ok=True)
+                tmp_path = blob_path.with_name(blob_path.name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, blob_path)
+                stored = True
+            finally:
+                self._release(digest, writing, stored)
+        return blob_path
+
+    def put_file(self, digest, path, size):
+        """把已写好的临时文件移入存储，内容已存在时删除临时文件（已不存在时忽略），返回内容文件路径"""
+        blob_path = self.blob_path(digest)
+        writing = self._claim(digest, size)
+        if writing:
+            stored = False
+            try:
+                if self.fsync:
+                    with open(path, 'rb+') as f:
+                        os.fsync(f.fileno())
+                blob_path.parent.mkdir(exist_ok=True)
+                os.replace(path, blob_path)
+                stored = True
+            finally:
+                self._release(digest, writing, stored)
+        else:
+            # 同一临时文件可能已在另一次保存中移入存储
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return blob_path
+
+    def link(self, digest, dest):
+        """让 dest 指向内容文件，优先使用硬链接，已存在的 dest 会被原子替换"""
+        blob_path = self.blob_path(digest)
+        dest = Path(dest)
+        tmp_path = dest.with_name(f'.{dest.name}.tmp')
+        if self._link_supported:
+            try:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                os.link(blob_path, tmp_path)
+                os.replace(tmp_path, dest)
+                with self._lock:
+                    self.stats['links'] += 1
+                return
+            except FileNotFoundError:
+                raise
+            except OSError as e:
+                logger.warning(f"无法创建硬链接，改为复制文件: {str(e)}")
+                self._link_supported = False
+
+        shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, dest)
+        with self._lock:
+            self.stats['copies'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
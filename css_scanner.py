@@ -0,0 +1,222 @@
+import re
+import threading
+from collections import namedtuple
+
+
+# CSS中的一个资源引用：类型（url / import / image-set）、引用的地址、在原文中的起止位置
+CssReference = namedtuple('CssReference', ['kind', 'url', 'start', 'end'])
+
+# 带转义的字符串，遇到换行或文件结尾时结束
+_STRING = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*(?:"|\n|\Z)' + r"|'[^'\\\n]*(?:\\.[^'\\\n]*)*(?:'|\n|\Z)"
+# 单遍扫描时关心的记号：注释、字符串、url()、@import 和 image-set(，其余字符直接跳过
+# 开头的前瞻只在可能开始记号的字符处尝试匹配，避免在每个字符上尝试全部分支
+_TOKEN_PATTERN = re.compile(
+    r'(?=[/"\'uU@iI-])'
+    r'(?:(?P<comment>/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|/\*.*\Z)'
+    r'|(?P<string>' + _STRING + r')'
+    r'|(?P<url>(?<![\w-])[uU][rR][lL]\(\s*(?P<quoted>' + _STRING + r')?(?P<bare>[^)]*)\))'
+    r'|(?P<import>@[iI][mM][pP][oO][rR][tT](?![\w-]))'
+    r'|(?P<image_set>(?<![\w-])(?:-[wW][eE][bB][kK][iI][tT]-)?[iI][mM][aA][gG][eE]-[sS][eE][tT]\())',
+    re.DOTALL
+)
+_WHITESPACE = ' \t\r\n\f'
+
+
+def _string_value(token):
+    """去掉字符串记号两端的引号"""
+    value = token[1:]
+    if value.endswith(token[0]):
+        value = value[:-1]
+    return value.rstrip('\n')
+
+
+def _url_value(match):
+    """返回 url() 记号中的地址，引号外还有其他内容时视为格式错误返回None"""
+    if match.group('quoted'):
+        if match.group('bare').strip(_WHITESPACE):
+            return None
+        return _string_value(match.group('quoted'))
+    return match.group('bare').strip(_WHITESPACE)
+
+
+def scan_css_references(css):
+    """单遍扫描CSS，找出 url()、@import 和 image-set() 中引用的地址
+
+    注释中的内容会被跳过，url() 和字符串中的特殊字符不会被误认为记号。
+    """
+    references = []
+    pending_import = None
+    image_set_depth = 0
+    paren_stack = []
+    last_end = 0
+    for match in _TOKEN_PATTERN.finditer(css):
+        kind = match.lastgroup if match.lastgroup not in ('quoted', 'bare') else 'url'
+        start = match.start()
+        
+        # @import 之后只能隔着空白和注释紧跟地址
+        if pending_import is not None and kind != 'comment' and css[last_end:start].strip(_WHITESPACE):
+            pending_import = None
+        # image-set() 的参数范围按括号配对判断
+        if image_set_depth:
+            image_set_depth = _close_parens(css, last_end, start, image_set_depth)
+        last_end = match.end()
+        
+        if kind == 'comment':
+            continue
+        if kind == 'string':
+            if pending_import is not None:
+                references.append(CssReference('import', _string_value(match.group()), start, match.end()))
+            elif image_set_depth == 1:
+                references.append(CssReference('image-set', _string_value(match.group()), start, match.end()))
+            pending_import = None
+        elif kind == 'url':
+            value = _url_value(match)
+            if value is not None:
+                references.append(CssReference('import' if pending_import is not None else 'url', value, start, match.end()))
+            pending_import = None
+        elif kind == 'import':
+            pending_import = start
+        elif kind == 'image_set':
+            pending_import = None
+            if image_set_depth:
+                image_set_depth += 1
+            else:
+                image_set_depth = 1
+    return references
+
+
+def _close_parens(css, start, end, depth):
+    """根据 css[start:end] 中的括号更新 image-set() 的嵌套深度"""
+    for c in css[start:end]:
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return 0
+    return depth
+
+
+def rewrite_css(css, references, replace):
+    """按引用位置拼接改写后的CSS，replace(reference) 返回替换文本，返回None时保留原文"""
+    parts = []
+    last = 0
+    for reference in references:
+        replacement = replace(reference)
+        if replacement is None:
+            continue
+        parts.append(css[last:reference.start])
+        parts.append(replacement)
+        last = reference.end
+    parts.append(css[last:])
+    return ''.join(parts)
+
+
+class CssGraph:
+    """样式表之间的 @import 依赖图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.nodes = {}
+        self.cycles = []
+
+    def _node(self, url):
+        return self.nodes.setdefault(url, {'imports': [], 'assets': [], 'output': None})
+
+    def add_node(self, url):
+        with self._lock:
+            self._node(url)
+
+    def add_import(self, url, imported_url):
+        with self._lock:
+            imports = self._node(url)['imports']
+            if imported_url not in imports:
+                imports.append(imported_url)
+            self._node(imported_url)
+
+    def add_asset(self, url, asset_url):
+        with self._lock:
+            assets = self._node(url)['assets']
+            if asset_url not in assets:
+                assets.append(asset_url)
+
+    def set_output(self, url, filename):
+        with self._lock:
+            self._node(url)['output'] = filename
+
+    def add_cycle(self, path):
+        with self._lock:
+            self.cycles.append(list(path))
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'nodes': {
+                    url: {'imports': list(node['imports']), 'assets': list(node['assets']), 'output': node['output']}
+                    for url, node in self.nodes.items()
+                },
+                'cycles': [list(cycle) for cycle in self.cycles]
+            }
+
+
+# 压缩CSS时关心的记号：注释、字符串、url() 和空白
+_MINIFY_PATTERN = re.compile(
+    r'(?P<comment>/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|/\*.*\Z)'
+    r'|(?P<string>' + _STRING + r')'
+    r'|(?P<url>(?<![\w-])[uU][rR][lL]\(\s*(?:' + _STRING + r')?[^)]*\))'
+    r'|(?P<space>\s+)',
+    re.DOTALL
+)
+# 这些字符前后的空白可以去掉
+_TIGHT_BEFORE = set('{};,>')
+_TIGHT_AFTER = set('{};,>:(')
+# 冒号之后先遇到 { 的是选择器（如 "a :hover"），冒号前的空白不能去掉
+_STATEMENT_END = re.compile(r'[{};]')
+
+
+def minify_css(css):
+    """去掉注释和多余的空白，字符串和 url() 保持原样
+
+    以 /*! 开头的注释（通常是许可证）会保留；选择器中冒号前的空白有意义（如 "a :hover"），不会去掉。
+    """
+    # (文本, 是否为普通CSS文本)，只有普通文本中的分号可以去掉
+    parts = []
+
+    def append_raw(text):
+        text = re.sub(r';+}', '}', text)
+        if text.startswith('}'):
+            # 去掉上一段普通文本末尾的分号
+            while parts and parts[-1][1] and parts[-1][0].endswith(';'):
+                parts[-1] = (parts[-1][0].rstrip(';'), True)
+                if parts[-1][0]:
+                    break
+                parts.pop()
+        parts.append((text, True))
+
+    last = 0
+    for match in _MINIFY_PATTERN.finditer(css):
+        if match.start() > last:
+            append_raw(css[last:match.start()])
+        last = match.end()
+        kind = match.lastgroup
+        token = match.group()
+        if kind == 'comment':
+            if token.startswith('/*!'):
+                parts.append((token, False))
+            continue
+        if kind == 'space':
+            previous = parts[-1][0][-1:] if parts else ''
+            following = css[last:last + 1]
+            if (not previous or not following or previous.isspace()
+                    or previous in _TIGHT_AFTER or following in _TIGHT_BEFORE):
+                continue
+            if following == ':':
+                end = _STATEMENT_END.search(css, last + 1)
+                if not end or end.group() != '{':
+                    continue
+            parts.append((' ', True))
+            continue
+        parts.append((token, False))
+    if last < len(css):
+        append_raw(css[last:])
+    return ''.join(text for text, _ in parts).strip()
@@ -0,0 +1,134 @@
+import os
+import sys
+import shutil
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+
+# Linux 上的 FICLONE ioctl，在支持写时复制的文件系统（btrfs、xfs 等）上克隆文件
+FICLONE = 0x40049409
+
+MIRROR_MODES = ('copy', 'hardlink', 'reflink', 'reference', 'auto')
+
+
+def _reflink(src, dest):
+    """以写时复制的方式克隆文件，不支持时抛出 OSError"""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+            try:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            except OSError:
+                dest_file.close()
+                os.unlink(dest)
+                raise
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL('libc.dylib', use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dest), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    else:
+        raise OSError('当前平台不支持 reflink')
+    shutil.copystat(src, dest)
+
+
+class FileMirror:
+    """把不需要修改的文件镜像到输出目录
+
+    mode 可选：
+    - copy：复制文件（默认）
+    - hardlink：创建硬链接，输出文件与源文件共享同一份数据
+    - reflink：在支持写时复制的文件系统上克隆文件
+    - reference：创建指向源文件的符号链接，不复制数据
+    - auto：优先 reflink，不支持时复制
+    不支持所选方式时回退为复制；复制在 workers 个线程中并行进行，metrics 不为空时记录每个文件的耗时。
+    """
+
+    def __init__(self, mode='copy', workers=4, metrics=None):
+        if mode not in MIRROR_MODES:
+            raise ValueError(f"未知的镜像方式: {mode}")
+        self.mode = mode
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='mirror')
+        self._futures = []
+        self._lock = threading.Lock()
+        self._supported = mode != 'copy'
+        self._created_dirs = set()
+        self.metrics = metrics
+        self.stats = {'files': 0, 'bytes_copied': 0, 'bytes_avoided': 0, 'fallbacks': 0}
+
+    def _make_parent(self, dest):
+        parent = dest.parent
+        if parent in self._created_dirs:
+            return
+        parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._created_dirs.add(parent)
+
+    def _fast_mirror(self, src, tmp_path):
+        mode = 'reflink' if self.mode == 'auto' else self.mode
+        if mode == 'hardlink':
+            os.link(src, tmp_path)
+        elif mode == 'reflink':
+            _reflink(src, tmp_path)
+        elif mode == 'reference':
+            os.symlink(os.path.abspath(src), tmp_path)
+
+    def _mirror(self, src, dest):
+        if self.metrics is None:
+            return self._mirror_file(src, dest)
+        with self.metrics.phase('copy'):
+            return self._mirror_file(src, dest)
+
+    def _mirror_file(self, src, dest):
+        self._make_parent(dest)
+        size = os.path.getsize(src)
+        tmp_path = dest.with_name(f'.{dest.name}.mirror')
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+
+        avoided = False
+        if self._supported:
+            try:
+                self._fast_mirror(src, tmp_path)
+                avoided = True
+            except OSError as e:
+                # 跨设备、文件系统或权限不支持时，之后的文件都直接复制
+                logger.warning(f"镜像方式 {self.mode} 不可用，改为复制文件: {str(e)}")
+                self._supported = False
+                with self._lock:
+                    self.stats['fallbacks'] += 1
+        if not avoided:
+            shutil.copy2(src, tmp_path)
+
+        # 输出文件已存在时（如增量模式）原子替换
+        os.replace(tmp_path, dest)
+        with self._lock:
+            self.stats['files'] += 1
+            self.stats['bytes_avoided' if avoided else 'bytes_copied'] += size
+        logger.debug(f"{'链接' if avoided else '复制'}文件: {dest}")
+
+    def mirror(self, src, dest):
+        """提交一个镜像任务，返回其 Future，尚未开始的任务可以取消"""
+        future = self._executor.submit(self._mirror, Path(src), Path(dest))
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        """等待已提交的任务完成（跳过已取消的任务），有任务失败时抛出第一个异常"""
+        futures, self._futures = self._futures, []
+        errors = [future.exception() for future in futures if not future.cancelled()]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def close(self, cancel=False):
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['mode'] = self.mode
+        return stats
@@ -0,0 +1,188 @@
+import time
+import random
+import threading
+from collections import deque
+import requests
+
+
+# 可以重试的HTTP状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 运行报告中最多保留的决策记录数
+MAX_DECISIONS = 1000
+
+
+class HostUnavailable(Exception):
+    """主机的熔断器处于打开状态，请求被直接拒绝"""
+
+
+class _HostState:
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.probing = False
+        self.next_request_at = 0.0
+        self.stats = {
+            'requests': 0, 'successes': 0, 'failures': 0, 'retries': 0,
+            'rejected': 0, 'circuit_opened': 0, 'rate_limited': 0, 'rate_limit_wait': 0.0
+        }
+
+
+class HostPolicy:
+    """按主机跟踪健康状况，决定是否重试、熔断和限速
+
+    - 超时、连接错误以及 429/5xx 视为临时错误，最多重试 retries 次，
+      等待时间为 [0, min(backoff_max, backoff_base * 2^attempt)] 内的随机值（full jitter），
+      服务器给出 Retry-After 时取两者中较大的（不超过 backoff_max）；
+    - 同一主机（host:port）连续 failure_threshold 次超时或连接错误后熔断，之后的请求直接失败，
+      reset_timeout 秒后放行一个探测请求，成功则恢复；5xx 只重试，不触发熔断；
+    - rate_limits 为 {主机名或 host:port: 每秒请求数}，default_rate_limit 用于其余主机，None 表示不限速；
+    - sleep 为限速时使用的等待函数，默认 time.sleep，可以换成能被取消打断的等待。
+    """
+
+    def __init__(self, retries=2, backoff_base=0.5, backoff_max=8.0, failure_threshold=3,
+                 reset_timeout=60.0, rate_limits=None, default_rate_limit=None, seed=None, sleep=None):
+        self.retries = max(0, int(retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.rate_limits = dict(rate_limits or {})
+        self.default_rate_limit = default_rate_limit
+        self._random = random.Random(seed)
+        self._sleep = sleep or time.sleep
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.decisions = deque(maxlen=MAX_DECISIONS)
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+        return state
+
+    def _decide(self, host, decision, url=None, **details):
+        """记录一条决策，调用时需持有锁"""
+        entry = {'time': round(time.time(), 3), 'host': host, 'decision': decision}
+        if url:
+            entry['url'] = url
+        entry.update(details)
+        self.decisions.append(entry)
+
+    def before_request(self, host, url=None):
+        """请求前调用：熔断时抛出 HostUnavailable，需要限速时等待，返回等待的秒数"""
+        host = host or ''
+        with self._lock:
+            state = self._host(host)
+            if state.state == 'open':
+                if time.monotonic() - state.opened_at < self.reset_timeout or state.probing:
+                    state.stats['rejected'] += 1
+                    raise HostUnavailable(f"主机 {host} 已熔断")
+                # 冷却时间已过，只放行一个探测请求
+                state.state = 'half_open'
+                state.probing = True
+                self._decide(host, 'circuit_half_open', url)
+            elif state.state == 'half_open' and state.probing:
+                state.stats['rejected'] += 1
+                raise HostUnavailable(f"主机 {host} 正在探测恢复")
+            state.stats['requests'] += 1
+
+            # 令牌桶限速：按顺序为每个请求预留发送时间
+            wait = 0.0
+            rate = self.rate_limits.get(host) or self.rate_limits.get(host.rsplit(':', 1)[0]) or self.default_rate_limit
+            if rate:
+                now = time.monotonic()
+                slot = max(now, state.next_request_at)
+                state.next_request_at = slot + 1.0 / rate
+                wait = slot - now
+                if wait > 0:
+                    state.stats['rate_limited'] += 1
+                    state.stats['rate_limit_wait'] += wait
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def record_success(self, host):
+        """请求完成（包括 4xx 等说明主机可用的响应）"""
+        host = host or ''
+        with self._lock:
+            state = self._host(host)
+            state.stats['successes'] += 1
+            state.consecutive_failures = 0
+            if state.state != 'closed':
+                state.state = 'closed'
+                state.probing = False
+                self._decide(host, 'circuit_closed')
+
+    def classify(self, error):
+        """返回 (是否临时错误, 是否说明主机不可达, 原因)"""
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            return status in RETRYABLE_STATUS, False, str(status)
+        if isinstance(error, (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                              ConnectionResetError, TimeoutError)):
+            return True, True, type(error).__name__
+        return False, False, type(error).__name__
+
+    def _retry_after(self, error):
+        response = getattr(error, 'response', None)
+        value = response.headers.get('Retry-After') if response is not None else None
+        if value and value.strip().isdigit():
+            return float(value.strip())
+        return 0.0
+
+    def record_failure(self, host, url, error, attempt):
+        """请求失败后调用，需要重试时返回等待的秒数，否则返回None"""
+        host = host or ''
+        transient, unreachable, reason = self.classify(error)
+        with self._lock:
+            state = self._host(host)
+            if not transient:
+                # 主机有响应（如 404），不影响健康状况
+                if isinstance(error, requests.HTTPError):
+                    state.stats['successes'] += 1
+                    state.consecutive_failures = 0
+                # 探测请求因非临时错误失败（如 404、超过大小限制、写入出错）时同样结束探测，否则之后的请求都会被拒绝
+                if state.state == 'half_open':
+                    state.state = 'closed'
+                    state.probing = False
+                    self._decide(host, 'circuit_closed')
+                return None
+
+            state.stats['failures'] += 1
+            if not unreachable:
+                # 5xx 说明主机仍然可达
+                state.consecutive_failures = 0
+                if state.state == 'half_open':
+                    state.state = 'closed'
+                    state.probing = False
+                    self._decide(host, 'circuit_closed')
+            else:
+                state.consecutive_failures += 1
+            if unreachable and (state.state == 'half_open' or state.consecutive_failures >= self.failure_threshold):
+                if state.state != 'open':
+                    state.stats['circuit_opened'] += 1
+                    self._decide(host, 'circuit_open', url, reason=reason, failures=state.consecutive_failures)
+                state.state = 'open'
+                state.opened_at = time.monotonic()
+                state.probing = False
+                return None
+            if attempt >= self.retries:
+                self._decide(host, 'give_up', url, reason=reason, attempts=attempt + 1)
+                return None
+
+            delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            delay = min(self.backoff_max, max(delay, self._retry_after(error)))
+            state.stats['retries'] += 1
+            self._decide(host, 'retry', url, reason=reason, attempt=attempt + 1, delay=round(delay, 3))
+            return delay
+
+    def to_dict(self):
+        with self._lock:
+            hosts = {}
+            for host, state in self._hosts.items():
+                stats = dict(state.stats)
+                stats['rate_limit_wait'] = round(stats['rate_limit_wait'], 3)
+                stats['state'] = state.state
+                hosts[host] = stats
+            return {'hosts': hosts, 'decisions': list(self.decisions)}
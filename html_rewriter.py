@@ -0,0 +1,419 @@
+import os
+import re
+import mmap
+import html
+from pathlib import Path
+from collections import namedtuple
+
+
+# HTML中的一个资源引用：资源地址、类型、属性值（含引号）在原文中的字节起止位置和引号，
+# 整个元素的起止位置和合并键（属性相同、位置相邻的引用可以合并，None 表示不能合并），以及引用的种类：
+# url 属性值就是地址；srcset 属性值是多个候选地址（url 为整个属性值）；
+# style 为 style 属性中的CSS，style_block 为 <style> 元素的内容（url 为CSS文本）
+HtmlReference = namedtuple(
+    'HtmlReference', ['url', 'file_type', 'start', 'end', 'quote', 'tag_start', 'tag_end', 'bundle_key', 'kind'],
+    defaults=(None, None, None, 'url')
+)
+
+# 内联CSS在引用列表中的类型，值为CSS文本，替换结果为改写后的CSS
+INLINE_STYLE = 'style'
+
+# <link rel="preload" as="..."> 对应的资源类型
+_PRELOAD_TYPES = {'style': 'css', 'script': 'js', 'font': 'fonts', 'image': 'images'}
+# 作为页面图标的 link rel
+_ICON_RELS = {'icon', 'shortcut', 'apple-touch-icon', 'apple-touch-icon-precomposed', 'mask-icon'}
+# 只引用媒体文件的元素，<source> 的类型取决于 type 属性
+_MEDIA_ELEMENTS = {'video', 'audio'}
+# 可能引用资源的元素，以及决定引用的属性，这些属性重复时无法确定哪个生效
+_ASSET_ELEMENTS = {b'link', b'script', b'img', b'source', b'video', b'audio'}
+_ASSET_ATTRIBUTES = {b'rel', b'as', b'type', b'href', b'src', b'srcset', b'imagesrcset', b'poster'}
+
+# 超过这个大小的页面通过 mmap 读取，改写时直接从映射区写出未修改的部分
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
+# 标签、注释和声明的开头
+_MARKUP_PATTERN = re.compile(rb'<(?:(?P<comment>!--)|(?P<decl>[!?])|(?P<close>/)?(?P<name>[A-Za-z][^\t\n\f\r />]*))')
+# 标签中的一个属性，或标签的结尾
+_ATTRIBUTE_PATTERN = re.compile(
+    rb'[\t\n\f\r /]*(?:(?P<end>>)|(?P<name>[^\t\n\f\r />][^\t\n\f\r /=>]*)'
+    rb'(?:[\t\n\f\r ]*=[\t\n\f\r ]*(?P<value>"[^"]*"|\'[^\']*\'|[^\t\n\f\r >]+))?)'
+)
+# 内容不按标签解析的元素
+_RAW_TEXT_ELEMENTS = {b'script', b'style', b'textarea', b'title'}
+# 可以合并的脚本类型，模块脚本各自有独立的作用域
+_BUNDLE_SCRIPT_TYPES = {'', 'text/javascript', 'application/javascript'}
+_BUNDLE_STYLE_TYPES = {'', 'text/css'}
+_RAW_TEXT_END_PATTERNS = {
+    name: re.compile(rb'</' + name + rb'[\t\n\f\r />]', re.IGNORECASE)
+    for name in _RAW_TEXT_ELEMENTS
+}
+
+
+class HtmlSyntaxError(ValueError):
+    """页面结构无法可靠地按位置改写，需要回退到完整解析"""
+
+
+def _parse_attributes(data, pos):
+    """解析标签属性，返回 (标签结束后的位置, {属性名: (值, 值的起止位置)})，重复的属性名记为 None"""
+    attributes = {}
+    while True:
+        match = _ATTRIBUTE_PATTERN.match(data, pos)
+        if match is None:
+            raise HtmlSyntaxError(f'位置 {pos} 的标签未闭合')
+        pos = match.end()
+        if match.group('end'):
+            return pos, attributes
+        name = bytes(match.group('name')).lower()
+        if match.group('value') is None:
+            value = (b'', pos, pos)
+        else:
+            value = (bytes(match.group('value')), match.start('value'), match.end('value'))
+        attributes[name] = None if name in attributes else value
+
+
+def _attribute_text(value):
+    """去掉属性值两端的引号并解码字符引用"""
+    if value[:1] in (b'"', b"'"):
+        value = value[1:-1]
+    try:
+        return html.unescape(value.decode('utf-8'))
+    except UnicodeDecodeError:
+        raise HtmlSyntaxError('属性值不是有效的UTF-8')
+
+
+def _is_remote(url):
+    return url.startswith(('http://', 'https://'))
+
+
+def asset_attributes(name, attributes):
+    """单次判断标签中哪些属性引用了资源，返回 [(属性名, 种类, 资源类型)]
+
+    name 为小写标签名，attributes 为 {小写属性名: 属性值文本}；种类为 url、srcset 或 style。
+    """
+    found = []
+    if name == 'link':
+        rel = set(attributes.get('rel', '').lower().split())
+        if 'stylesheet' in rel:
+            found.append(('href', 'url', 'css'))
+        elif 'modulepreload' in rel:
+            found.append(('href', 'url', 'js'))
+        elif 'preload' in rel:
+            file_type = _PRELOAD_TYPES.get(attributes.get('as', '').lower())
+            if file_type:
+                found.append(('href', 'url', file_type))
+            if file_type == 'images' and 'imagesrcset' in attributes:
+                found.append(('imagesrcset', 'srcset', 'images'))
+        elif rel & _ICON_RELS:
+            found.append(('href', 'url', 'images'))
+    elif name == 'script':
+        found.append(('src', 'url', 'js'))
+    elif name == 'img':
+        found.append(('src', 'url', 'images'))
+        found.append(('srcset', 'srcset', 'images'))
+    elif name == 'source':
+        found.append(('srcset', 'srcset', 'images'))
+        media_type = attributes.get('type', '').lower()
+        found.append(('src', 'url', 'images' if media_type.startswith('image/') else 'media'))
+    elif name in _MEDIA_ELEMENTS:
+        found.append(('src', 'url', 'media'))
+        if name == 'video':
+            found.append(('poster', 'url', 'images'))
+    if 'url(' in attributes.get('style', '').lower():
+        found.append(('style', 'style', INLINE_STYLE))
+    return [
+        (attr, kind, file_type) for attr, kind, file_type in found
+        if attr in attributes and _has_remote_reference(kind, attributes[attr])
+    ]
+
+
+def _has_remote_reference(kind, value):
+    if kind == 'style':
+        return True
+    if kind == 'srcset':
+        return bool(_srcset_urls(value))
+    return _is_remote(value)
+
+
+def _srcset_candidates(value):
+    """按 HTML 规范切分 srcset，返回每个候选地址在属性值中的 (起, 止) 位置"""
+    candidates = []
+    pos = 0
+    length = len(value)
+    while pos < length:
+        while pos < length and (value[pos].isspace() or value[pos] == ','):
+            pos += 1
+        start = pos
+        while pos < length and not value[pos].isspace():
+            pos += 1
+        end = pos
+        # 地址末尾的逗号是分隔符，此时没有描述符
+        while end > start and value[end - 1] == ',':
+            end -= 1
+        if end == pos:
+            depth = 0
+            while pos < length and (depth or value[pos] != ','):
+                if value[pos] == '(':
+                    depth += 1
+                elif value[pos] == ')':
+                    depth = max(0, depth - 1)
+                pos += 1
+        if end > start:
+            candidates.append((start, end))
+    return candidates
+
+
+def _srcset_urls(value):
+    return [value[start:end] for start, end in _srcset_candidates(value) if _is_remote(value[start:end])]
+
+
+def rewrite_srcset(value, replace):
+    """替换 srcset 中的候选地址，replace(url) 返回None时保留原地址"""
+    parts = []
+    last = 0
+    for start, end in _srcset_candidates(value):
+        replacement = replace(value[start:end])
+        if replacement:
+            parts.append(value[last:start])
+            parts.append(replacement)
+            last = end
+    parts.append(value[last:])
+    return ''.join(parts)
+
+
+def reference_assets(kind, value, file_type):
+    """一个引用需要本地化的 [(url 或CSS文本, 类型)]"""
+    if kind == 'srcset':
+        return [(url, file_type) for url in _srcset_urls(value)]
+    return [(value, file_type)]
+
+
+def _tag_references(name, attributes):
+    """返回标签中引用资源的 HtmlReference 列表，按属性在标签中的位置排序"""
+    for attr, value in attributes.items():
+        if value is None and (attr == b'style' or name in _ASSET_ELEMENTS and attr in _ASSET_ATTRIBUTES):
+            raise HtmlSyntaxError(f'{name.decode()} 标签有重复的 {attr.decode()} 属性')
+    if name not in _ASSET_ELEMENTS and b'style' not in attributes:
+        return []
+
+    texts = {attr.decode('latin-1'): _attribute_text(value[0]) for attr, value in attributes.items() if value is not None}
+    references = []
+    for attr, kind, file_type in asset_attributes(name.decode('latin-1'), texts):
+        key = attr.encode('latin-1')
+        raw, start, end = attributes[key]
+        quote = raw[:1].decode() if raw[:1] in (b'"', b"'") else ''
+        # 只有样式表链接和外部脚本可以合并
+        bundleable = kind == 'url' and (
+            name == b'script' or name == b'link' and 'stylesheet' in texts.get('rel', '').lower().split())
+        bundle_key = _bundle_key(name, attributes, key) if bundleable else None
+        references.append(HtmlReference(texts[attr], file_type, start, end, quote, bundle_key=bundle_key, kind=kind))
+    return sorted(references, key=lambda reference: reference.start)
+
+
+def _bundle_key(tag, attributes, url_attr):
+    """除地址和类型外的其余属性，相同的相邻引用合并后行为不变；带完整性校验、async 或模块脚本不能合并"""
+    if any(value is None for value in attributes.values()):
+        return None
+    values = {name: _attribute_text(value[0]) for name, value in attributes.items() if name != url_attr}
+    if b'integrity' in values or b'async' in values:
+        return None
+    # 默认类型和显式写出的 text/javascript、text/css 等价
+    allowed_types = _BUNDLE_SCRIPT_TYPES if tag == b'script' else _BUNDLE_STYLE_TYPES
+    if values.pop(b'type', '').strip().lower() not in allowed_types:
+        return None
+    return tuple(sorted(values.items()))
+
+
+def scan_html_references(data):
+    """单遍扫描HTML字节内容，找出所有资源引用及其在原文中的位置
+
+    包括样式表、脚本、图片及 srcset、预加载、图标、<source>、视频封面，以及 <style> 元素和 style 属性中的CSS；
+    注释、声明以及 script/textarea 等元素的内容会被跳过；标签或注释未闭合、引用属性重复时抛出 HtmlSyntaxError。
+    """
+    references = []
+    pos = 0
+    while True:
+        match = _MARKUP_PATTERN.search(data, pos)
+        if match is None:
+            return references
+        if match.group('comment'):
+            end = data.find(b'-->', match.end())
+            if end < 0:
+                raise HtmlSyntaxError(f'位置 {match.start()} 的注释未闭合')
+            pos = end + 3
+            continue
+        if match.group('decl'):
+            end = data.find(b'>', match.end())
+            if end < 0:
+                raise HtmlSyntaxError(f'位置 {match.start()} 的声明未闭合')
+            pos = end + 1
+            continue
+
+        name = bytes(match.group('name')).lower()
+        pos, attributes = _parse_attributes(data, match.end())
+        if match.group('close'):
+            continue
+        tag_references = _tag_references(name, attributes)
+        tag_end = pos
+        if name in _RAW_TEXT_ELEMENTS:
+            end = _RAW_TEXT_END_PATTERNS[name].search(data, pos)
+            if end is None:
+                raise HtmlSyntaxError(f'{name.decode()} 元素未闭合')
+            content_start, pos = pos, end.start()
+            # 元素包括结束标签
+            close_end = data.find(b'>', end.end() - 1)
+            tag_end = close_end + 1 if close_end >= 0 else len(data)
+            if name == b'style':
+                tag_references.extend(_style_block_reference(data, content_start, pos))
+        references.extend(
+            reference._replace(tag_start=match.start(), tag_end=tag_end) for reference in tag_references
+        )
+
+
+def _style_block_reference(data, start, end):
+    """<style> 元素中引用了资源的CSS"""
+    content = bytes(data[start:end])
+    lower = content.lower()
+    if b'url(' not in lower and b'@import' not in lower:
+        return []
+    try:
+        css = content.decode('utf-8')
+    except UnicodeDecodeError:
+        raise HtmlSyntaxError('style 元素不是有效的UTF-8')
+    return [HtmlReference(css, INLINE_STYLE, start, end, None, kind='style_block')]
+
+
+def _quote_attribute(value, quote):
+    """生成替换后的属性值，沿用原来的引号"""
+    quote = quote or '"'
+    value = value.replace('&', '&amp;').replace(quote, '&#34;' if quote == '"' else '&#39;')
+    return f'{quote}{value}{quote}'.encode('utf-8')
+
+
+def _replacement_bytes(reference, replacements):
+    """按引用的种类生成替换后的原文，不需要替换时返回None"""
+    if reference.kind == 'srcset':
+        value = rewrite_srcset(reference.url, lambda url: replacements.get((url, reference.file_type)))
+        return _quote_attribute(value, reference.quote) if value != reference.url else None
+    replacement = replacements.get((reference.url, reference.file_type))
+    if not replacement:
+        return None
+    if reference.kind == 'style_block':
+        return replacement.encode('utf-8')
+    return _quote_attribute(replacement, reference.quote)
+
+
+class HtmlDocument:
+    """按位置改写的HTML页面
+
+    只记录需要替换的属性值在原文中的位置，改写时把新值拼接到未修改的原文片段之间，
+    不重新序列化整个页面；较大的页面通过 mmap 读取，写出时不复制未修改的内容。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._mmap = None
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            if size >= MMAP_THRESHOLD:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.data = self._mmap
+            else:
+                self.data = f.read()
+        try:
+            self._references = scan_html_references(self.data)
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def references(self):
+        """页面引用的资源 [(url, file_type)]，按页面中的顺序；内联CSS的类型为 style，值为CSS文本"""
+        return [
+            asset
+            for reference in self._references
+            for asset in reference_assets(reference.kind, reference.url, reference.file_type)
+        ]
+
+    def _bundle_runs(self):
+        """相邻（中间只有空白）、类型和合并键相同的引用，返回引用下标的列表"""
+        runs = []
+        run = []
+        for index, reference in enumerate(self._references):
+            if reference.bundle_key is None and not run:
+                continue
+            if run:
+                previous = self._references[run[-1]]
+                if (reference.bundle_key is not None and reference.file_type == previous.file_type
+                        and reference.bundle_key == previous.bundle_key
+                        and not bytes(self.data[previous.tag_end:reference.tag_start]).strip()):
+                    run.append(index)
+                    continue
+                if len(run) > 1:
+                    runs.append(run)
+            run = [index] if reference.bundle_key is not None else []
+        if len(run) > 1:
+            runs.append(run)
+        return runs
+
+    def bundle_groups(self):
+        """可以合并为一个文件的引用组 [((url, file_type), ...)]，组内保持页面中的顺序"""
+        return [
+            tuple((self._references[index].url, self._references[index].file_type) for index in run)
+            for run in self._bundle_runs()
+        ]
+
+    def prepare(self, replacements, bundles=None):
+        """按 {(url, file_type): 本地路径} 计算需要的替换，返回把改写后的页面写入二进制文件对象的函数，
+        没有可替换的引用时返回None
+
+        bundles 为 {引用组: 合并文件的本地路径}，组内第一个元素改为引用合并文件，其余元素删除。
+        写入前页面不能关闭，可以在其他线程中写入。
+        """
+        bundles = bundles or {}
+        merged = {}
+        for run in self._bundle_runs():
+            group = tuple((self._references[index].url, self._references[index].file_type) for index in run)
+            if bundles.get(group):
+                merged[run[0]] = (bundles[group], self._references[run[-1]].tag_end)
+                merged.update((index, None) for index in run[1:])
+
+        patches = []
+        for index, reference in enumerate(self._references):
+            if index in merged:
+                if merged[index] is not None:
+                    local_path, skip_to = merged[index]
+                    patches.append((reference, _quote_attribute(local_path, reference.quote), skip_to))
+                continue
+            replacement = _replacement_bytes(reference, replacements)
+            if replacement is not None:
+                patches.append((reference, replacement, None))
+        if not patches:
+            return None
+
+        def produce(f):
+            with memoryview(self.data) as view:
+                last = 0
+                for reference, replacement, skip_to in patches:
+                    if reference.start < last:
+                        # 位于已删除的合并元素中
+                        continue
+                    f.write(view[last:reference.start])
+                    f.write(replacement)
+                    last = reference.end
+                    if skip_to is not None:
+                        # 合并组中其余的元素
+                        f.write(view[last:reference.tag_end])
+                        last = skip_to
+                f.write(view[last:])
+        return produce
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
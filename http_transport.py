@@ -0,0 +1,178 @@
+import time
+import socket
+import weakref
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# 模拟浏览器请求的默认请求头
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive'
+}
+
+
+class ConnectionStats:
+    """统计每个主机的请求数和新建连接数，metrics 不为空时同时记录建立连接（含DNS解析）的耗时"""
+
+    def __init__(self, metrics=None):
+        self._lock = threading.Lock()
+        self.metrics = metrics
+        self.hosts = {}
+
+    def _host(self, host):
+        return self.hosts.setdefault(host, {'requests': 0, 'connections': 0})
+
+    def record_request(self, host):
+        with self._lock:
+            self._host(host or '')['requests'] += 1
+
+    def record_connection(self, host, seconds=None):
+        with self._lock:
+            self._host(host or '')['connections'] += 1
+        if self.metrics is not None and seconds is not None:
+            self.metrics.observe('connect', seconds)
+
+    def snapshot(self):
+        """返回连接复用统计"""
+        with self._lock:
+            hosts = {host: dict(item) for host, item in self.hosts.items()}
+        requests_total = sum(item['requests'] for item in hosts.values())
+        connections_total = sum(item['connections'] for item in hosts.values())
+        for item in hosts.values():
+            item['reused'] = max(0, item['requests'] - item['connections'])
+        return {
+            'requests': requests_total,
+            'connections': connections_total,
+            'reused': max(0, requests_total - connections_total),
+            'reuse_ratio': round(1 - connections_total / requests_total, 4) if requests_total else 0.0,
+            'hosts': hosts
+        }
+
+
+class ConnectionRegistry:
+    """弱引用记录建立过的连接的套接字，套接字被回收后自动移除
+
+    记录套接字而不是连接对象：服务器不保持连接时，http.client 在读完响应头后就把套接字从连接上摘下，
+    之后只有响应对象还引用它。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sockets = weakref.WeakSet()
+
+    def add(self, sock):
+        with self._lock:
+            self._sockets.add(sock)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._sockets)
+
+
+def _counting_pool_class(base_class, stats, connections):
+    """生成统计请求数和实际建立连接数的连接池类，建立的连接的套接字登记到 connections 中"""
+    class CountingConnection(base_class.ConnectionCls):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                stats.record_connection(self.host, time.perf_counter() - start)
+                if self.sock is not None:
+                    connections.add(self.sock)
+
+    class CountingConnectionPool(base_class):
+        ConnectionCls = CountingConnection
+
+        def urlopen(self, *args, **kwargs):
+            stats.record_request(self.host)
+            return super().urlopen(*args, **kwargs)
+    return CountingConnectionPool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """为连接池统计新建连接数的适配器"""
+
+    def __init__(self, stats, connections, **kwargs):
+        self.stats = stats
+        self.connections = connections
+        super().__init__(**kwargs)
+
+    def _install_pool_classes(self, manager):
+        manager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self.stats, self.connections),
+            'https': _counting_pool_class(HTTPSConnectionPool, self.stats, self.connections)
+        }
+        return manager
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._install_pool_classes(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        is_new = proxy not in self.proxy_manager
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if is_new:
+            self._install_pool_classes(manager)
+        return manager
+
+
+class PooledTransport:
+    """长连接复用的共享HTTP传输层
+
+    所有请求共用一个 requests.Session，每个主机最多保持 max_connections_per_host
+    个连接（超出时等待空闲连接），timeout 可以是秒数或 (连接超时, 读取超时)。
+    """
+
+    def __init__(self, proxies=None, max_connections_per_host=10, max_hosts=32,
+                 timeout=30, max_redirects=5, headers=None, metrics=None):
+        self.timeout = timeout
+        self.stats = ConnectionStats(metrics)
+        # 建立过的连接，abort() 时关闭其中仍然打开的连接
+        self.connections = ConnectionRegistry()
+        self.session = requests.Session()
+        self.session.max_redirects = max_redirects
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        if proxies:
+            self.session.proxies.update(proxies)
+
+        adapter = PooledHTTPAdapter(
+            self.stats,
+            self.connections,
+            pool_connections=max_hosts,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        """发送GET请求，默认允许重定向并使用配置的超时"""
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('allow_redirects', True)
+        return self.session.get(url, **kwargs)
+
+    def abort(self):
+        """中断所有正在进行的传输：关闭每个连接的套接字，阻塞在读写上的线程会立即出错返回
+
+        可以在任意线程中调用；之后连接池中的连接都不可再用，只在整个运行取消时使用。
+        """
+        aborted = 0
+        for sock in self.connections.snapshot():
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                aborted += 1
+            except OSError:
+                pass
+        return aborted
+
+    def get_stats(self):
+        return self.stats.snapshot()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import functools
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+
+
+# 单个任务和整个批次的退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+# 汇总多个任务的退出码时，前面的优先
+EXIT_SEVERITY = (EXIT_FAILED, EXIT_USAGE, EXIT_PARTIAL)
+
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {extra[job]} | {level} | {message}"
+
+
+class JobError(ValueError):
+    """任务清单或任务参数无效"""
+
+
+@functools.lru_cache(maxsize=None)
+def localizer_options():
+    """任务中可以设置的 ResourceLocalizer 参数，base_dir / proxy / output_dir 由任务本身的字段决定
+
+    本地化模块在第一次需要时才导入，--help 和参数错误不必等待它加载。
+    """
+    from localize_resources import ResourceLocalizer
+    return frozenset(inspect.signature(ResourceLocalizer.__init__).parameters) - {'self', 'base_dir', 'proxy', 'output_dir'}
+
+
+def load_manifest(path):
+    """读取任务清单，返回 (默认参数, 任务列表)
+
+    清单是JSON，可以直接是任务列表，也可以是 {"defaults": {...}, "jobs": [...]}；
+    每个任务包含 input，可选 name、output、proxy 和 options。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs'), list):
+        raise JobError('任务清单必须是任务列表或包含 jobs 列表的对象')
+    defaults = manifest.get('defaults') or {}
+    if not isinstance(defaults, dict):
+        raise JobError('defaults 必须是对象')
+
+    base = Path(path).resolve().parent
+    jobs = []
+    for index, job in enumerate(manifest['jobs']):
+        if isinstance(job, str):
+            job = {'input': job}
+        if not isinstance(job, dict) or not job.get('input'):
+            raise JobError(f'第 {index + 1} 个任务缺少 input')
+        job = dict(job)
+        # 清单中的相对路径相对于清单文件所在目录
+        job['input'] = str(base / job['input'])
+        if job.get('output'):
+            job['output'] = str(base / job['output'])
+        jobs.append(job)
+    return defaults, jobs
+
+
+def assign_job_names(jobs):
+    """为任务确定唯一的名称，默认取输入目录名，重名时追加输入路径的哈希"""
+    names = [job.get('name') or Path(job['input']).name for job in jobs]
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    for job, name in zip(jobs, names):
+        if counts[name] > 1 and not job.get('name'):
+            name = f"{name}_{hashlib.sha1(job['input'].encode('utf-8')).hexdigest()[:8]}"
+        job['name'] = name
+    seen = set()
+    for job in jobs:
+        if job['name'] in seen:
+            raise JobError(f"任务名称重复: {job['name']}")
+        seen.add(job['name'])
+    return jobs
+
+
+def resolve_output_dir(job, output_root=None, deterministic=False):
+    """确定任务的输出目录
+
+    任务指定了 output 时直接使用；否则有 output_root 时为 output_root/任务名；
+    deterministic 为 True 时为输入目录旁的 {任务名}_localized，不带时间戳，同一输入的多个任务各自输出；
+    都没有时返回None，由 ResourceLocalizer 使用带时间戳的目录。
+    """
+    if job.get('output'):
+        return Path(job['output'])
+    if output_root:
+        return Path(output_root) / job['name']
+    if deterministic:
+        return Path(job['input']).parent / f"{job['name']}_localized"
+    return None
+
+
+def check_output_dirs(jobs):
+    """多个任务写入同一输出目录时互相覆盖，直接报错"""
+    seen = {}
+    for job in jobs:
+        if not job.get('output_dir'):
+            continue
+        output_dir = os.path.normcase(os.path.abspath(job['output_dir']))
+        if output_dir in seen:
+            raise JobError(f"任务 {seen[output_dir]} 和 {job['name']} 的输出目录相同: {job['output_dir']}")
+        seen[output_dir] = job['name']
+
+
+def build_job_options(job, defaults, shared_options):
+    """合并命令行共享参数、清单默认参数和任务参数，后者优先"""
+    options = dict(shared_options)
+    options.update(defaults.get('options') or {})
+    options.update(job.get('options') or {})
+    unknown = set(options) - localizer_options()
+    if unknown:
+        raise JobError(f"未知的参数: {', '.join(sorted(unknown))}")
+    # JSON 中没有元组，(连接超时, 读取超时) 以列表给出
+    if isinstance(options.get('timeout'), list):
+        options['timeout'] = tuple(options['timeout'])
+    return options
+
+
+def setup_logging(name, log_level='INFO', log_dir=None):
+    """日志输出到标准错误，每行带任务名；指定 log_dir 时同时写入 {任务名}.log"""
+    logger.remove()
+    logger.configure(extra={'job': name})
+    logger.add(sys.stderr, level=log_level, format=LOG_FORMAT)
+    if log_dir:
+        logger.add(Path(log_dir) / f"{name}.log", level='DEBUG', format=LOG_FORMAT)
+
+
+def run_job(job, log_level='INFO', log_dir=None):
+    """在工作进程中运行一个任务，返回任务结果"""
+    setup_logging(job['name'], log_level, log_dir)
+
+    result = {
+        'name': job['name'],
+        'input': job['input'],
+        'output': job.get('output_dir'),
+        'exit_code': EXIT_OK,
+        'error': None,
+        'seconds': 0.0
+    }
+    start = time.perf_counter()
+    try:
+        if job.get('error'):
+            raise JobError(job['error'])
+        if not Path(job['input']).is_dir():
+            raise JobError(f"输入目录不存在: {job['input']}")
+        from localize_resources import ResourceLocalizer
+        localizer = ResourceLocalizer(job['input'], job.get('proxy'), output_dir=job.get('output_dir'), **job['options'])
+        result['output'] = str(localizer.output_dir)
+        completed = localizer.process_directory()
+        report = localizer.get_run_report()
+        result['counters'] = report['metrics']['counters']
+        result['host_failures'] = report['metrics']['host_failures']
+        if not completed:
+            # 超过 deadline 时已完成的部分保留，增量模式下再次运行从中断处继续
+            run = report['run']
+            result['exit_code'] = EXIT_PARTIAL
+            result['error'] = (f"运行未完成（{run['cancelled']}），"
+                               f"已完成 {run['pages_done']}/{run['pages_total']} 个页面")
+        elif report['metrics']['counters'].get('failures'):
+            result['exit_code'] = EXIT_PARTIAL
+    except JobError as e:
+        result['exit_code'] = EXIT_USAGE
+        result['error'] = str(e)
+        logger.error(str(e))
+    except Exception as e:
+        result['exit_code'] = EXIT_FAILED
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        logger.exception(f"任务失败: {str(e)}")
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def combined_exit_code(results):
+    codes = {result['exit_code'] for result in results}
+    for code in EXIT_SEVERITY:
+        if code in codes:
+            return code
+    return EXIT_OK
+
+
+def summarize(results, seconds):
+    """汇总所有任务的结果"""
+    totals = {}
+    for result in results:
+        for name, value in (result.get('counters') or {}).items():
+            totals[name] = totals.get(name, 0) + value
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(seconds, 3),
+        'exit_code': combined_exit_code(results),
+        'jobs': len(results),
+        'succeeded': sum(result['exit_code'] == EXIT_OK for result in results),
+        'partial': sum(result['exit_code'] == EXIT_PARTIAL for result in results),
+        'failed': sum(result['exit_code'] in (EXIT_FAILED, EXIT_USAGE) for result in results),
+        'counters': dict(sorted(totals.items())),
+        'results': results
+    }
+
+
+def run_batch(jobs, processes=1, log_level='INFO', log_dir=None):
+    """用进程池运行任务，结果按任务顺序返回"""
+    if processes <= 1 or len(jobs) <= 1:
+        return [run_job(job, log_level, log_dir) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(processes, len(jobs))) as pool:
+        futures = [pool.submit(run_job, job, log_level, log_dir) for job in jobs]
+        try:
+            return [future.result() for future in futures]
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='批量本地化多个站点中的外部资源')
+    parser.add_argument('manifest', nargs='?', help='任务清单JSON文件')
+    parser.add_argument('--input', action='append', default=[], help='要处理的目录，可多次指定，与清单中的任务一起运行')
+    parser.add_argument('--output', default=None, help='只有一个 --input 时的输出目录')
+    parser.add_argument('--output-root', default=None, help='所有任务的输出都放在此目录下，子目录为任务名')
+    parser.add_argument('--deterministic-names', action='store_true',
+                        help='输出目录使用 {目录名}_localized，不带时间戳')
+    parser.add_argument('--proxy', default=None, help='默认代理，格式为 ip:port')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='同时运行的任务数')
+    parser.add_argument('--cache-dir', default=None, help='所有任务共用的持久化缓存目录')
+    parser.add_argument('--workers', type=int, default=None, help='每个任务的并发下载线程数')
+    parser.add_argument('--summary', default=None, help='汇总结果JSON文件')
+    parser.add_argument('--log-dir', default=None, help='每个任务的日志文件目录')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args(argv)
+    if not args.manifest and not args.input:
+        parser.error('需要任务清单或至少一个 --input')
+    if args.output and len(args.input) != 1:
+        parser.error('--output 只能与一个 --input 一起使用')
+    return args
+
+
+def prepare_jobs(args):
+    """根据命令行参数和任务清单生成任务列表"""
+    defaults, jobs = load_manifest(args.manifest) if args.manifest else ({}, [])
+    for input_dir in args.input:
+        jobs.append({'input': str(Path(input_dir).resolve()), 'output': args.output})
+    assign_job_names(jobs)
+
+    shared_options = {}
+    if args.cache_dir:
+        shared_options['cache_dir'] = str(Path(args.cache_dir).resolve())
+    if args.workers:
+        shared_options['max_workers'] = args.workers
+    output_root = args.output_root or defaults.get('output_root')
+    deterministic = args.deterministic_names or bool(defaults.get('deterministic_names'))
+    for job in jobs:
+        # 参数无效的任务不影响其他任务，运行时以参数错误结束
+        try:
+            job['options'] = build_job_options(job, defaults, shared_options)
+        except JobError as e:
+            job['options'] = {}
+            job['error'] = str(e)
+        # 命令行指定的代理优先于清单的默认代理
+        job.setdefault('proxy', args.proxy or defaults.get('proxy'))
+        output_dir = resolve_output_dir(job, output_root, deterministic)
+        job['output_dir'] = str(output_dir) if output_dir else None
+    check_output_dirs(jobs)
+    return jobs
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging('batch', args.log_level)
+
+    try:
+        jobs = prepare_jobs(args)
+    except (JobError, OSError, json.JSONDecodeError) as e:
+        logger.error(f"无法读取任务: {str(e)}")
+        return EXIT_USAGE
+
+    logger.info(f"共 {len(jobs)} 个任务，同时运行 {max(1, min(args.processes, len(jobs)))} 个")
+    start = time.perf_counter()
+    results = run_batch(jobs, args.processes, args.log_level, args.log_dir)
+    # 串行运行时任务修改了当前进程的日志配置
+    setup_logging('batch', args.log_level)
+    summary = summarize(results, time.perf_counter() - start)
+
+    for result in results:
+        status = {EXIT_OK: '成功', EXIT_PARTIAL: '部分资源失败', EXIT_USAGE: '参数错误', EXIT_FAILED: '失败'}[result['exit_code']]
+        logger.info(f"[{result['exit_code']}] {result['name']}: {status}，耗时 {result['seconds']}s，输出 {result['output']}")
+    logger.info(f"完成 {summary['jobs']} 个任务：成功 {summary['succeeded']}，部分失败 {summary['partial']}，失败 {summary['failed']}")
+    if args.summary:
+        Path(args.summary).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary['exit_code']
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
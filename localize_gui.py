@@ -1,8 +1,13 @@
 import tkinter as tk
+import multiprocessing
 from tkinter import ttk, filedialog, scrolledtext
 import threading
-from localize_resources import ResourceLocalizer
+import queue
+import time
+from collections import deque
 from loguru import logger
+# 取消令牌模块很轻，启动时直接导入
+from cancellation import CancelToken, DEADLINE
 import sys
 import os
 
@@ -15,13 +20,44 @@ def get_resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def format_bytes(size):
+    """把字节数格式化为便于阅读的字符串"""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{int(size)} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}" if seconds >= 3600 else f"{seconds // 60:02d}:{seconds % 60:02d}"
+
 class ResourceLocalizerGUI:
+    # 日志级别及其显示顺序
+    LOG_LEVELS = ['DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR']
+    # 日志区域最多保留的行数
+    MAX_LOG_LINES = 5000
+    # 每次刷新界面时最多处理的日志行数和刷新间隔（毫秒）
+    LOG_BATCH_SIZE = 500
+    POLL_INTERVAL = 100
+    # 计算下载速度的时间窗口（秒）
+    THROUGHPUT_WINDOW = 5.0
+    # 窗口显示后多久开始在后台加载本地化模块（毫秒）
+    PRELOAD_DELAY = 200
+
     def __init__(self, root):
         self.root = root
         self.root.title("资源本地化工具")
         
-        # 初始化取消标志
-        self.cancel_flag = False
+        # 当前运行的取消令牌
+        self.cancel_token = None
+        
+        # 工作线程只把日志和进度事件放入队列，由界面线程定时批量取出
+        self.log_queue = queue.Queue()
+        self.event_queue = queue.Queue()
+        # 最近的日志行 (级别, 文本)，超出上限时丢弃最早的行
+        self.log_lines = deque(maxlen=self.MAX_LOG_LINES)
+        self.reset_progress()
         
         # 设置图标
         try:
@@ -62,6 +98,21 @@ class ResourceLocalizerGUI:
         proxy_entry = ttk.Entry(input_frame, textvariable=self.proxy_var)
         proxy_entry.grid(row=1, column=1, sticky='ew', padx=5, pady=2)
         
+        # 并发下载线程数
+        ttk.Label(input_frame, text="并发数:").grid(row=2, column=0, sticky='w', padx=5, pady=2)
+        self.workers_var = tk.IntVar(value=8)
+        workers_spinbox = ttk.Spinbox(input_frame, from_=1, to=64, textvariable=self.workers_var, width=6)
+        workers_spinbox.grid(row=2, column=1, sticky='w', padx=5, pady=2)
+        
+        # 进度区域
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.grid(row=3, column=0, sticky='ew', padx=5, pady=2)
+        progress_frame.grid_columnconfigure(0, weight=1)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress_bar.grid(row=0, column=0, sticky='ew', padx=5, pady=2)
+        self.status_var = tk.StringVar(value="就绪")
+        ttk.Label(progress_frame, textvariable=self.status_var).grid(row=1, column=0, sticky='w', padx=5)
+        
         # 按钮区域
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=1, column=0, sticky='ew', padx=5, pady=2)
@@ -75,6 +126,14 @@ class ResourceLocalizerGUI:
         self.cancel_button = ttk.Button(button_frame, text="取消本地化", command=self.cancel_localization, state='disabled')
         self.cancel_button.grid(row=0, column=2, padx=5)
         
+        # 日志级别过滤
+        ttk.Label(button_frame, text="日志级别:").grid(row=0, column=3, padx=(5, 0))
+        self.level_var = tk.StringVar(value='INFO')
+        level_combobox = ttk.Combobox(button_frame, textvariable=self.level_var, values=self.LOG_LEVELS,
+                                      state='readonly', width=9)
+        level_combobox.grid(row=0, column=4, padx=5)
+        level_combobox.bind('<<ComboboxSelected>>', lambda event: self.refresh_log_view())
+        
         # 日志输出区域
         log_frame = ttk.LabelFrame(main_frame, text="日志输出")
         log_frame.grid(row=2, column=0, sticky='nsew', padx=5, pady=2)
@@ -88,6 +147,7 @@ class ResourceLocalizerGUI:
         self.log_text.grid(row=0, column=0, sticky='nsew', padx=5, pady=2)
         
         # 配置日志文本框标签
+        self.log_text.tag_configure('DEBUG', foreground='gray')
         self.log_text.tag_configure('INFO', foreground='black')
         self.log_text.tag_configure('SUCCESS', foreground='green')
         self.log_text.tag_configure('WARNING', foreground='orange')
@@ -95,11 +155,12 @@ class ResourceLocalizerGUI:
         
         # 配置日志处理器
         self.setup_logger()
+        self.root.after(self.POLL_INTERVAL, self.poll_queues)
         
         # 设置最小窗口大小
         self.root.update_idletasks()
         min_width = max(input_frame.winfo_reqwidth(), log_frame.winfo_reqwidth()) + 20
-        min_height = input_frame.winfo_reqheight() + button_frame.winfo_reqheight() + 200  # 给日志区域预留更多空间
+        min_height = input_frame.winfo_reqheight() + button_frame.winfo_reqheight() + progress_frame.winfo_reqheight() + 200  # 给日志区域预留更多空间
         self.root.minsize(min_width, min_height)
         
         # 设置初始窗口大小
@@ -111,28 +172,122 @@ class ResourceLocalizerGUI:
         y = (screen_height - height) // 2
         self.root.geometry(f"{width}x{height}+{x}+{y}")
         
+        # 本地化模块依赖 requests、urllib3 等较重的库，窗口显示后再在后台线程中加载
+        self.root.after(self.PRELOAD_DELAY, self.preload_localizer)
+        
+    def preload_localizer(self):
+        """在后台线程中提前导入本地化模块，开始本地化时不必再等待导入"""
+        def preload():
+            try:
+                import localize_resources  # noqa: F401
+            except Exception as e:
+                logger.warning(f"预加载本地化模块失败: {str(e)}")
+        threading.Thread(target=preload, name='preload', daemon=True).start()
+        
     def setup_logger(self):
         """配置日志处理器"""
         logger.remove()  # 移除所有现有的处理器
         
-        # 添加自定义处理器
-        logger.add(self.log_handler, level="INFO", format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}")
+        # 添加自定义处理器，级别过滤在界面中进行
+        logger.add(self.log_handler, level="DEBUG", format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}")
         
     def log_handler(self, message):
-        """自定义日志处理器"""
-        # 从消息中提取日志级别
-        if "| ERROR |" in message:
-            tag = 'ERROR'
-        elif "| SUCCESS |" in message:
-            tag = 'SUCCESS'
-        elif "| WARNING |" in message:
-            tag = 'WARNING'
-        else:
-            tag = 'INFO'
-            
-        self.log_text.insert(tk.END, message + "\n", tag)
+        """自定义日志处理器，可能在任意线程中调用，只把日志放入队列"""
+        level = message.record['level'].name
+        self.log_queue.put((level if level in self.LOG_LEVELS else 'INFO', str(message).rstrip('\n')))
+    
+    def is_level_visible(self, level):
+        return self.LOG_LEVELS.index(level) >= self.LOG_LEVELS.index(self.level_var.get())
+    
+    def poll_queues(self):
+        """在界面线程中定时批量取出日志和进度事件"""
+        try:
+            self.drain_log_queue()
+            self.drain_event_queue()
+        finally:
+            self.root.after(self.POLL_INTERVAL, self.poll_queues)
+    
+    def drain_log_queue(self):
+        lines = []
+        try:
+            while len(lines) < self.LOG_BATCH_SIZE:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not lines:
+            return
+        
+        self.log_lines.extend(lines)
+        visible = [(level, text) for level, text in lines if self.is_level_visible(level)]
+        if not visible:
+            return
+        for level, text in visible[-self.MAX_LOG_LINES:]:
+            self.log_text.insert(tk.END, text + "\n", level)
+        # 文本框只保留最近的行
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > self.MAX_LOG_LINES:
+            self.log_text.delete('1.0', f'{line_count - self.MAX_LOG_LINES + 1}.0')
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
+    
+    def refresh_log_view(self):
+        """级别过滤变化时按保留的日志重新显示"""
+        self.log_text.delete('1.0', tk.END)
+        for level, text in self.log_lines:
+            if self.is_level_visible(level):
+                self.log_text.insert(tk.END, text + "\n", level)
+        self.log_text.see(tk.END)
+    
+    def reset_progress(self):
+        self.files_total = 0
+        self.files_done = 0
+        self.assets_fetched = 0
+        self.assets_failed = 0
+        self.bytes_fetched = 0
+        self.started_at = time.monotonic()
+        # 最近一段时间内每次下载完成的 (时间, 字节数)，用于计算速度
+        self.recent_bytes = deque()
+    
+    def drain_event_queue(self):
+        changed = False
+        try:
+            while True:
+                self.handle_progress_event(self.event_queue.get_nowait())
+                changed = True
+        except queue.Empty:
+            pass
+        if changed:
+            self.update_progress()
+    
+    def handle_progress_event(self, event):
+        kind = event.get('event')
+        if kind == 'files_total':
+            self.files_total = event['total']
+        elif kind == 'file_done':
+            self.files_done = event['done']
+        elif kind == 'asset_fetched':
+            self.assets_fetched += 1
+            self.bytes_fetched += event['bytes']
+            self.recent_bytes.append((time.monotonic(), event['bytes']))
+        elif kind == 'asset_failed':
+            self.assets_failed += 1
+    
+    def update_progress(self):
+        """根据进度事件更新进度条、下载速度和剩余时间"""
+        now = time.monotonic()
+        while self.recent_bytes and now - self.recent_bytes[0][0] > self.THROUGHPUT_WINDOW:
+            self.recent_bytes.popleft()
+        window = min(self.THROUGHPUT_WINDOW, max(now - self.started_at, 1.0))
+        speed = sum(size for _, size in self.recent_bytes) / window
+        
+        self.progress_bar.config(maximum=max(self.files_total, 1), value=self.files_done)
+        status = f"文件 {self.files_done}/{self.files_total} | 资源 {self.assets_fetched}"
+        if self.assets_failed:
+            status += f"（失败 {self.assets_failed}）"
+        status += f" | {format_bytes(self.bytes_fetched)} | {format_bytes(speed)}/s"
+        if 0 < self.files_done < self.files_total:
+            remaining = (now - self.started_at) / self.files_done * (self.files_total - self.files_done)
+            status += f" | 剩余 {format_duration(remaining)}"
+        self.status_var.set(status)
         
     def browse_base_dir(self):
         """浏览选择基础目录"""
@@ -144,52 +299,59 @@ class ResourceLocalizerGUI:
         """开始本地化过程"""
         base_dir = self.base_dir_var.get()
         proxy = self.proxy_var.get()
+        try:
+            max_workers = max(1, self.workers_var.get())
+        except tk.TclError:
+            max_workers = 1
         
         if not base_dir:
             logger.error("请选择基础目录")
             return
         
-        # 清空日志
+        # 清空日志和进度
         self.log_text.delete(1.0, tk.END)
+        self.log_lines.clear()
+        self.reset_progress()
+        self.progress_bar.config(value=0)
+        self.status_var.set("正在扫描目录...")
         
-        # 重置取消标志
-        self.cancel_flag = False
+        # 每次运行使用新的取消令牌
+        self.cancel_token = CancelToken()
         
         # 禁用开始按钮，启用取消按钮
         self.start_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.NORMAL)
         
         # 在新线程中运行本地化过程
-        thread = threading.Thread(target=self.run_localization, args=(base_dir, proxy))
+        thread = threading.Thread(target=self.run_localization, args=(base_dir, proxy, max_workers, self.cancel_token))
         thread.daemon = True
         thread.start()
         
     def cancel_localization(self):
-        """取消本地化过程"""
-        self.cancel_flag = True
+        """取消本地化过程：正在进行的下载立即中断，已完成的文件保留在输出目录中"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
         logger.warning("正在取消本地化过程...")
+        self.status_var.set("正在取消...")
         self.cancel_button.config(state=tk.DISABLED)
         
-    def run_localization(self, base_dir, proxy):
+    def run_localization(self, base_dir, proxy, max_workers=1, cancel_token=None):
         """运行本地化过程"""
         try:
-            localizer = ResourceLocalizer(base_dir, proxy)
-            
-            def check_cancel():
-                if self.cancel_flag:
-                    raise Exception("用户取消了本地化过程")
-                return True
-            
-            # 添加取消检查到localizer
-            localizer.check_cancel = check_cancel
+            # 通常已由 preload_localizer 导入，这里只是取出模块
+            from localize_resources import ResourceLocalizer
+            localizer = ResourceLocalizer(base_dir, proxy, max_workers=max_workers, cancel_token=cancel_token)
+            # 进度事件放入队列，由界面线程处理
+            localizer.on_progress = self.event_queue.put
             
-            localizer.process_directory()
-            logger.success("资源本地化完成！")
-        except Exception as e:
-            if "用户取消了本地化过程" in str(e):
-                logger.warning("本地化过程已取消")
+            if localizer.process_directory():
+                logger.success("资源本地化完成！")
+            elif localizer.cancel_token.reason == DEADLINE:
+                logger.warning("本地化过程超过截止时间，已停止")
             else:
-                logger.error(f"处理过程中发生错误: {str(e)}")
+                logger.warning("本地化过程已取消")
+        except Exception as e:
+            logger.error(f"处理过程中发生错误: {str(e)}")
         finally:
             # 重新启用开始按钮，禁用取消按钮
             self.root.after(0, lambda: self.start_button.config(state=tk.NORMAL))
@@ -204,7 +366,14 @@ def main():
     style.configure('TButton', padding=2)
     
     app = ResourceLocalizerGUI(root)
+    if '--startup-probe' in sys.argv[1:]:
+        # 启动时间测试：窗口绘制完成后立即退出
+        root.update()
+        root.destroy()
+        return
     root.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的程序使用多进程解析HTML时需要
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
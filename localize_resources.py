@@ -1,8 +1,6 @@
 import os
 import re
-import requests
 import urllib.parse
-from bs4 import BeautifulSoup
 from pathlib import Path
 import hashlib
 import base64
@@ -10,30 +8,340 @@ import mimetypes
 import shutil
 from loguru import logger
 from datetime import datetime
-import chardet
-import gzip
-import brotli
+import json
+import threading
+import time
+import tempfile
+import codecs
+import importlib.util
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from http_transport import PooledTransport
+from resource_cache import ResourceCache
+from css_scanner import CssGraph, scan_css_references, rewrite_css, minify_css
+from content_store import ContentStore
+from file_mirror import FileMirror
+from output_writer import OutputWriter, write_atomic
+from asset_postprocess import Precompressor
+from resource_pack import ResourcePack, ResourcePackWriter
+from html_rewriter import (HtmlDocument, HtmlSyntaxError, INLINE_STYLE, asset_attributes, reference_assets,
+                           rewrite_srcset)
+from host_policy import HostPolicy
+from cancellation import AssetTimeout, Cancelled, CancelToken, DEADLINE
+from run_metrics import RunMetrics, RunProfiler, write_json_report, write_prometheus_textfile
+
+# 完整下载的结果：内容、响应的 Content-Type、重定向后的最终URL
+Resource = namedtuple('Resource', ['content', 'content_type', 'url'])
+
+# 流式下载到临时文件的结果：临时文件路径、大小、内容的 sha256、响应的 Content-Type、重定向后的最终URL
+StreamedFile = namedtuple('StreamedFile', ['path', 'size', 'digest', 'content_type', 'url'], defaults=(None, None))
+
+class SingleFlight:
+    """合并对同一个键的并发调用：同一时间只执行一次，其余调用等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+        if not is_leader:
+            return future.result()
+        
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+# 可选的HTML解析器及其依赖的模块
+HTML_PARSER_MODULES = {
+    'html.parser': None,
+    'lxml': 'lxml',
+    'html5lib': 'html5lib'
+}
+
+def resolve_html_parser(parser):
+    """返回可用的BeautifulSoup解析器名称，auto 时优先使用 lxml，不可用时回退到 html.parser"""
+    if parser == 'auto':
+        return 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+    if parser not in HTML_PARSER_MODULES:
+        logger.warning(f"未知的HTML解析器 {parser}，使用 html.parser")
+        return 'html.parser'
+    module = HTML_PARSER_MODULES[parser]
+    if module and importlib.util.find_spec(module) is None:
+        logger.warning(f"HTML解析器 {parser} 未安装，使用 html.parser")
+        return 'html.parser'
+    return parser
+
+def _find_html_references(soup):
+    """单次遍历页面，查找引用资源的属性和 <style> 元素，返回 [(标签, 属性, 种类, 值, file_type)]
+
+    <style> 元素的属性为None，值为其中的CSS。
+    """
+    references = []
+    for tag in soup.find_all(True):
+        # rel 等多值属性被解析为列表
+        attributes = {name: ' '.join(value) if isinstance(value, list) else value for name, value in tag.attrs.items()}
+        for attr, kind, file_type in asset_attributes(tag.name, attributes):
+            references.append((tag, attr, kind, attributes[attr], file_type))
+        if tag.name == 'style' and tag.string:
+            css = str(tag.string)
+            if 'url(' in css.lower() or '@import' in css.lower():
+                references.append((tag, None, 'style_block', css, INLINE_STYLE))
+    return references
+
+class SoupDocument:
+    """用 BeautifulSoup 完整解析的HTML页面，接口与 HtmlDocument 相同，用于格式不规范的页面"""
+
+    def __init__(self, path, parser='html.parser'):
+        # bs4 只在页面需要回退到完整解析时才加载
+        from bs4 import BeautifulSoup
+        with open(path, 'r', encoding='utf-8') as f:
+            self.soup = BeautifulSoup(f.read(), parser)
+        self._references = _find_html_references(self.soup)
+
+    @property
+    def references(self):
+        return [
+            asset
+            for _, _, kind, value, file_type in self._references
+            for asset in reference_assets(kind, value, file_type)
+        ]
+
+    def bundle_groups(self):
+        """完整解析的页面不合并引用"""
+        return []
+
+    def prepare(self, replacements, bundles=None):
+        modified = False
+        for tag, attr, kind, value, file_type in self._references:
+            if kind == 'srcset':
+                new_value = rewrite_srcset(value, lambda url: replacements.get((url, file_type)))
+                new_value = new_value if new_value != value else None
+            else:
+                new_value = replacements.get((value, file_type))
+            if not new_value:
+                continue
+            if attr is None:
+                tag.string = new_value
+            else:
+                tag[attr] = new_value
+            modified = True
+        if not modified:
+            return None
+        return lambda f: f.write(str(self.soup).encode('utf-8'))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_html_document(html_file, parser='html.parser'):
+    """按位置扫描HTML文件，页面格式不规范时回退到 BeautifulSoup 完整解析"""
+    try:
+        return HtmlDocument(html_file)
+    except HtmlSyntaxError as e:
+        logger.warning(f"无法按位置改写 {html_file}（{str(e)}），使用 {parser} 解析")
+        return SoupDocument(html_file, parser)
+
+def scan_html_file(html_file, parser='html.parser'):
+    """扫描HTML文件，返回 (需要本地化的资源 [(url, file_type)], 可以合并的引用组)"""
+    with open_html_document(html_file, parser) as document:
+        return document.references, document.bundle_groups()
+
+def rewrite_html_file(html_file, output_path, replacements, parser='html.parser', bundles=None, fsync=False):
+    """按 {(url, file_type): 本地路径} 和合并文件改写HTML文件中的引用，有修改时写入 output_path 并返回它
+
+    output_path 所在的目录需已存在。
+    """
+    with open_html_document(html_file, parser) as document:
+        produce = document.prepare(replacements, bundles)
+        if produce is not None:
+            write_atomic(output_path, produce, fsync)
+            return Path(output_path)
+    return None
 
 class ResourceLocalizer:
-    def __init__(self, base_dir, proxy=None):
+    FONT_EXTENSIONS = ['.woff', '.woff2', '.ttf', '.otf', '.eot']
+    IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp', '.avif', '.bmp', '.cur']
+    # 各类资源相对于 static/css 目录的路径
+    CSS_RELATIVE_DIRS = {'css': '.', 'fonts': './fonts', 'images': '../images', 'media': '../media'}
+    # 各类资源在页面中的路径
+    HTML_RELATIVE_DIRS = {
+        'css': './static/css', 'js': './static/js', 'fonts': './static/css/fonts',
+        'images': './static/images', 'media': './static/media'
+    }
+    # 内联时样式表和脚本使用的MIME类型，其余按文件扩展名判断
+    INLINE_MIME_TYPES = {'css': 'text/css', 'js': 'text/javascript'}
+    # 增量模式下记录上次运行结果的清单文件
+    MANIFEST_NAME = '.localize_manifest.json'
+    MANIFEST_VERSION = 2
+    # 文件名中用于区分不同内容的哈希前缀长度
+    HASH_NAME_LENGTH = 16
+    # chardet 检测编码时每次送入的字节数，以及最多送入的次数
+    CHARSET_SAMPLE_SIZE = 64 * 1024
+    CHARSET_SAMPLE_CHUNKS = 4
+    CSS_CHARSET_PATTERN = re.compile(rb'^@charset\s*["\']([A-Za-z0-9_.:-]+)["\']\s*;')
+    CSS_CHARSET_TEXT_PATTERN = re.compile(r'^@charset\s*["\'][^"\']*["\']\s*;')
+    CSS_NAMESPACE_PATTERN = re.compile(r'@namespace\b', re.IGNORECASE)
+    # 脚本开头（注释之后）的 "use strict" 指令
+    USE_STRICT_PATTERN = re.compile(rb'\s*(?:(?://[^\n]*\n|/\*.*?\*/)\s*)*["\']use strict["\']', re.DOTALL)
+    BOM_ENCODINGS = [
+        (codecs.BOM_UTF32_LE, 'utf-32'),
+        (codecs.BOM_UTF32_BE, 'utf-32'),
+        (codecs.BOM_UTF8, 'utf-8-sig'),
+        (codecs.BOM_UTF16_LE, 'utf-16'),
+        (codecs.BOM_UTF16_BE, 'utf-16')
+    ]
+    # 流式下载的块大小
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, base_dir, proxy=None, max_workers=1, timeout=30, max_connections_per_host=None,
+                 cache_dir=None, cache_ttl=86400, cache_max_size=512 * 1024 * 1024, offline=False,
+                 output_dir=None, incremental=False, parser='html.parser', html_processes=0,
+                 max_download_size=None, mirror_mode='copy', copy_workers=4, report_path=None,
+                 prometheus_path=None, profile_path=None, trace_memory=False, retries=2, backoff_base=0.5,
+                 backoff_max=8.0, circuit_threshold=3, circuit_reset=60.0, rate_limits=None,
+                 default_rate_limit=None, minify_css=False, precompress=(), compress_workers=4, bundle=False,
+                 inline_max_size=0, export_pack=None, pack=None, write_workers=2, write_queue_size=64, fsync='none',
+                 cancel_token=None, deadline=None, asset_deadline=None):
         self.base_dir = Path(base_dir)
-        self.output_dir = self.base_dir.parent / f"{self.base_dir.name}_localized_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # 增量模式需要复用固定的输出目录
+        self.incremental = incremental
+        if output_dir:
+            self.output_dir = Path(output_dir)
+        elif incremental:
+            self.output_dir = self.base_dir.parent / f"{self.base_dir.name}_localized"
+        else:
+            self.output_dir = self.base_dir.parent / f"{self.base_dir.name}_localized_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         self.static_dir = self.output_dir / 'static'
         self.css_dir = self.static_dir / 'css'
         self.js_dir = self.static_dir / 'js'
         self.fonts_dir = self.css_dir / 'fonts'
         self.images_dir = self.static_dir / 'images'
+        self.media_dir = self.static_dir / 'media'
+        # 流式下载的临时目录，与输出目录在同一文件系统上以便原子重命名
+        self.tmp_dir = self.output_dir / '.tmp'
+        # 按内容寻址的存储，相同内容只保存一份，各个文件名通过硬链接共享
+        self.blobs_dir = self.output_dir / '.blobs'
         self.proxies = {'http': f'http://{proxy}', 'https': f'http://{proxy}'} if proxy else None
         
+        # HTML解析器，以及并行解析/改写HTML的进程数（0 或 1 表示在当前进程中处理）
+        self.parser = resolve_html_parser(parser)
+        self.html_processes = max(0, int(html_processes or 0))
+        
+        # 各阶段的计时和计数；运行结束后写出JSON报告和 Prometheus textfile
+        self.metrics = RunMetrics()
+        self.report_path = report_path
+        self.prometheus_path = prometheus_path
+        # 可选的 cProfile 结果文件和 tracemalloc 内存统计
+        self.profiler = RunProfiler(profile_path, trace_memory) if profile_path or trace_memory else None
+        
+        # 取消令牌可以由调用方传入，在任意线程中调用 cancel_token.cancel() 或 self.cancel() 取消运行；
+        # deadline 为整个运行的截止秒数，asset_deadline 为单个资源（包括重试）的截止秒数，None 表示不限时
+        self.cancel_token = cancel_token or CancelToken()
+        self.deadline = deadline
+        self.asset_deadline = asset_deadline
+        
+        # 并发下载的工作线程数，1 表示串行下载
+        self.max_workers = max(1, int(max_workers or 1))
+        self._executor = None
+        
+        # 所有下载共用的HTTP连接池，timeout 可以是秒数或 (连接超时, 读取超时)
+        self.transport = PooledTransport(
+            proxies=self.proxies,
+            max_connections_per_host=max_connections_per_host or max(self.max_workers, 4),
+            timeout=timeout,
+            metrics=self.metrics
+        )
+        
+        # 按主机的重试、熔断和限速策略
+        self.host_policy = HostPolicy(
+            retries=retries,
+            backoff_base=backoff_base,
+            backoff_max=backoff_max,
+            failure_threshold=circuit_threshold,
+            reset_timeout=circuit_reset,
+            rate_limits=rate_limits,
+            default_rate_limit=default_rate_limit,
+            sleep=self.cancel_token.sleep
+        )
+        
+        # 非HTML文件的镜像方式：copy / hardlink / reflink / reference / auto
+        self.mirror = FileMirror(mirror_mode, workers=copy_workers, metrics=self.metrics)
+        
+        # 输出阶段：压缩样式表，并为 static 下的文本资源写出预压缩的 .gz / .br 文件
+        self.minify_css = minify_css
+        self.precompressor = Precompressor(precompress, workers=compress_workers, metrics=self.metrics) if precompress else None
+        
+        # 合并页面中相邻的样式表/脚本，以及把不超过 inline_max_size 字节的资源内联为 data URL
+        self.bundle = bundle
+        self.inline_max_size = max(0, int(inline_max_size or 0))
+        
+        # 单个资源的最大下载字节数，None 表示不限制
+        self.max_download_size = max_download_size
+        
+        # 跨运行的持久化缓存，offline 模式下只从缓存读取
+        self.cache = ResourceCache(cache_dir, ttl=cache_ttl, max_size=cache_max_size, offline=offline) if cache_dir else None
+        
+        # 离线资源包：export_pack 把本次下载的所有资源写入资源包，pack 只从资源包读取，不访问网络
+        if export_pack and pack:
+            raise ValueError('export_pack 和 pack 不能同时使用')
+        self.pack = ResourcePack(pack) if pack else None
+        self.pack_writer = ResourcePackWriter(export_pack) if export_pack else None
+        
+        # 输出文件在 write_workers 个后台线程中写入，fsync 为 none / file / full
+        self.writer = OutputWriter(write_workers, write_queue_size, fsync, metrics=self.metrics)
+        
         # 创建必要的目录
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.css_dir.mkdir(parents=True, exist_ok=True)
-        self.js_dir.mkdir(parents=True, exist_ok=True)
-        self.fonts_dir.mkdir(parents=True, exist_ok=True)
-        self.images_dir.mkdir(parents=True, exist_ok=True)
+        for directory in (self.output_dir, self.css_dir, self.js_dir, self.fonts_dir, self.images_dir,
+                          self.media_dir, self.tmp_dir):
+            self.writer.ensure_dir(directory)
+        self.content_store = ContentStore(self.blobs_dir, fsync=self.writer.fsync_files)
         
         # 用于跟踪已下载的文件
         self.downloaded_files = {}
+        # 本次运行已提交保存的路径，以及已交给写入线程移入内容存储的流式下载临时文件
+        self._saved_paths = set()
+        self._stored_spools = set()
+        
+        # 本次运行内的资源结果缓存 {(url, file_type): filename}，下载失败记为 None
+        self.asset_results = {}
+        self._fetch_flight = SingleFlight()
+        # 每个URL检测到的编码
+        self.charsets = {}
+        # 合并文件 {(file_type, 成员文件名...): 合并文件名}，无法合并时为None
+        self.bundle_results = {}
+        # 内联结果 {(file_type, filename): data URL}，不内联时为None
+        self.inline_results = {}
+        # 样式表之间的 @import 依赖图
+        self.css_graph = CssGraph()
+        
+        # 每个HTML文件引用的外部资源 {html_file: [(url, file_type), ...]}
+        self.page_assets = {}
+        # 本次运行的进度，运行未完成时报告已完成和未处理的部分
+        self.run_state = {
+            'completed': False, 'cancelled': None, 'walk_completed': False,
+            'pages_total': 0, 'pages_done': 0, 'pending_pages': [], 'mirror_cancelled': 0
+        }
+        # 增量模式的清单 {相对路径: 文件信息}
+        self.manifest_files = {}
         
         # 添加字体文件的MIME类型
         mimetypes.add_type('application/font-woff', '.woff')
@@ -41,12 +349,20 @@ class ResourceLocalizer:
         mimetypes.add_type('application/x-font-ttf', '.ttf')
         mimetypes.add_type('application/vnd.ms-fontobject', '.eot')
         
-        self.check_cancel = lambda: True  # 添加默认的检查函数
+        # 外部的取消检查函数，返回 False 时取消运行；新代码应使用 cancel_token
+        self.check_cancel = lambda: True
+        # 进度事件回调，参数为 {'event': 事件名, ...}，可能在下载线程中调用
+        self.on_progress = lambda event: None
         
         logger.info(f"初始化完成，输出目录: {self.output_dir}")
 
     def get_file_hash(self, content):
-        return hashlib.md5(content).hexdigest()[:8]
+        """返回内容的 sha256，用于判断内容是否相同"""
+        return hashlib.sha256(content).hexdigest()
+
+    def short_hash(self, digest):
+        """文件名中使用的哈希前缀"""
+        return digest[:self.HASH_NAME_LENGTH]
 
     def process_data_url(self, data_url):
         """处理data URL格式的资源"""
@@ -86,53 +402,260 @@ class ResourceLocalizer:
                 content = urllib.parse.unquote(data).encode('utf-8')
             
             # 生成文件名
-            filename = f"data_url_{self.get_file_hash(content)}{ext}"
+            filename = f"data_url_{self.short_hash(self.get_file_hash(content))}{ext}"
             logger.debug(f"生成data URL文件名: {filename}")
             return content, filename
         except Exception as e:
             logger.error(f"处理data URL失败: {str(e)}")
             return None
 
-    def decompress_content(self, content, content_encoding):
-        """解压缩内容"""
+    def to_data_url(self, content, mime_type):
+        """把内容编码为 base64 的 data URL，与 process_data_url 相反"""
+        return f"data:{mime_type};base64,{base64.b64encode(content).decode('ascii')}"
+
+    def inline_asset(self, file_type, filename):
+        """已保存的资源不超过 inline_max_size 时返回其 data URL，否则返回None
+
+        样式表中的相对引用在 data URL 中无法解析，只内联不再引用其他文件的样式表。
+        """
+        if not self.inline_max_size:
+            return None
+        key = (file_type, filename)
+        if key not in self.inline_results:
+            path = self.get_save_dir(file_type) / filename
+            self.writer.wait(path)
+            data_url = None
+            if path.stat().st_size <= self.inline_max_size:
+                content = path.read_bytes()
+                if file_type != 'css' or not scan_css_references(content.decode('utf-8')):
+                    mime_type = self.INLINE_MIME_TYPES.get(file_type) or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    data_url = self.to_data_url(content, mime_type)
+                    self.metrics.count('assets_inlined')
+            self.inline_results[key] = data_url
+        return self.inline_results[key]
+
+    def download_file(self, url):
+        """下载URL并返回完整内容"""
+        resource = self.download_resource(url)
+        return resource.content if resource else None
+
+    def download_resource(self, url):
+        """下载URL并返回包含内容和响应信息的 Resource，用于需要改写的CSS"""
+        return self._download(url, to_file=False)
+
+    def download_to_file(self, url):
+        """流式下载URL到临时文件，边写边计算哈希，返回 StreamedFile，用于字体、图片和JS"""
+        return self._download(url, to_file=True)
+
+    def _check_size(self, size):
+        if self.max_download_size is not None and size > self.max_download_size:
+            raise ValueError(f"内容大小 {size} 字节超过限制 {self.max_download_size} 字节")
+
+    def _read_chunks(self, chunks):
+        """把数据块读入内存，超过大小限制时中止"""
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            self._check_size(len(buffer))
+        return bytes(buffer)
+
+    def _spool(self, chunks, content_type=None, url=None):
+        """把数据块写入临时文件，同时计算哈希，超过大小限制时中止并删除临时文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, prefix='download_')
+        sha256 = hashlib.sha256()
+        size = 0
         try:
-            if content_encoding == 'gzip':
-                return gzip.decompress(content)
-            elif content_encoding == 'br':
-                return brotli.decompress(content)
-            return content
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    self._check_size(size)
+                    f.write(chunk)
+                    sha256.update(chunk)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return StreamedFile(Path(tmp_path), size, sha256.hexdigest(), content_type, url)
+
+    def _read_cached(self, cache_entry, to_file, url):
+        """读取缓存内容，缓存文件丢失时返回None"""
+        f = self.cache.open(cache_entry)
+        if f is None:
+            return None
+        with f:
+            if to_file:
+                return self._spool(self._guarded(iter(lambda: f.read(self.DOWNLOAD_CHUNK_SIZE), b'')),
+                                   cache_entry.content_type, url)
+            return Resource(self._read_chunks([f.read()]), cache_entry.content_type, url)
+
+    def _download(self, url, to_file):
+        with self.metrics.phase('download'):
+            result = self._request_resource(url, to_file)
+        if result is None:
+            self._emit_progress('asset_failed', url=url)
+        else:
+            size = result.size if to_file else len(result.content)
+            self._emit_progress('asset_fetched', url=url, bytes=size)
+            if self.pack_writer and not url.startswith('data:'):
+                if to_file:
+                    self.pack_writer.add_file(url, result.path, result.content_type, result.url,
+                                              size=result.size, digest=result.digest)
+                else:
+                    self.pack_writer.add(url, result.content, result.content_type, result.url)
+        return result
+
+    def _read_pack(self, url, to_file):
+        """从资源包读取内容，不在包中时返回None"""
+        entry = self.pack.lookup(url)
+        if entry is None:
+            logger.warning(f"资源包中没有: {url}")
+            self.metrics.record_failure(urllib.parse.urlsplit(url).hostname, self.pack.misses[url])
+            return None
+        self.metrics.count('pack_hits')
+        if to_file:
+            return self._spool(self._guarded(self.pack.iter_chunks(entry)), self.pack.content_type(entry), entry.get('url', url))
+        return Resource(self._read_chunks(self._guarded(self.pack.iter_chunks(entry))), self.pack.content_type(entry), entry.get('url', url))
+
+    def cancel(self):
+        """取消运行，可以在任意线程中调用：正在进行的下载立即中断，未开始的任务不再执行"""
+        self.cancel_token.cancel()
+
+    def is_cancelled(self):
+        """运行是否已被取消或超过截止时间，check_cancel 返回 False 时同样视为取消"""
+        if not self.cancel_token.cancelled and not self.check_cancel():
+            self.cancel_token.cancel()
+        return self.cancel_token.cancelled
+
+    def _guarded(self, chunks, deadline=None):
+        """逐块读取时检查取消和单个资源的截止时间"""
+        for chunk in chunks:
+            self.cancel_token.check()
+            if deadline is not None and time.monotonic() > deadline:
+                raise AssetTimeout(f"下载超过 {self.asset_deadline} 秒的截止时间")
+            yield chunk
+
+    def _request_timeout(self, deadline=None):
+        """按整体和单个资源的剩余时间缩短请求超时，使等待不会越过截止时间"""
+        limits = [self.cancel_token.remaining()]
+        if deadline is not None:
+            limits.append(max(0.0, deadline - time.monotonic()))
+        limits = [limit for limit in limits if limit is not None]
+        timeout = self.transport.timeout
+        if not limits:
+            return timeout
+        limit = max(0.001, min(limits))
+        if isinstance(timeout, tuple):
+            return tuple(limit if value is None else min(value, limit) for value in timeout)
+        return limit if timeout is None else min(timeout, limit)
+
+    def _emit_progress(self, event, **data):
+        """发送进度事件，回调出错时只记录日志，不影响本地化"""
+        data['event'] = event
+        try:
+            self.on_progress(data)
         except Exception as e:
-            logger.error(f"解压缩失败: {str(e)}")
-            return content
+            logger.debug(f"进度回调出错: {str(e)}")
 
-    def download_file(self, url):
+    def _request_resource(self, url, to_file):
         try:
             # 检查是否是data URL
             if url.startswith('data:'):
                 result = self.process_data_url(url)
-                if result:
-                    return result[0]
-                return None
+                if not result:
+                    return None
+                self.metrics.count('data_urls')
+                return self._spool([result[0]]) if to_file else Resource(result[0], None, url)
             
-            # 设置请求头，模拟浏览器请求
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive'
-            }
+            if self.pack is not None:
+                return self._read_pack(url, to_file)
             
-            logger.info(f"开始下载: {url}")
+            # 检查缓存，未过期或离线模式下直接使用缓存内容
+            cache_entry = self.cache.lookup(url) if self.cache else None
+            if cache_entry and (self.cache.offline or self.cache.is_fresh(cache_entry)):
+                content = self._read_cached(cache_entry, to_file, url)
+                if content is not None:
+                    logger.info(f"缓存命中: {url}")
+                    self.metrics.count('cache_hits')
+                    return content
+                cache_entry = None
+            if self.cache and self.cache.offline:
+                self.cache.record_miss()
+                logger.warning(f"离线模式，缓存未命中: {url}")
+                if self.pack_writer:
+                    self.pack_writer.add_missing(url, 'cache_miss')
+                return None
             
-            # 允许重定向
-            session = requests.Session()
-            session.max_redirects = 5
-            response = session.get(url, proxies=self.proxies, headers=headers, timeout=30, allow_redirects=True)
+            return self._fetch_with_retries(url, cache_entry, to_file)
+        except Cancelled:
+            raise
+        except Exception as e:
+            logger.error(f"下载失败 {url}: {str(e)}")
+            response = getattr(e, 'response', None)
+            reason = str(response.status_code) if response is not None else type(e).__name__
+            self.metrics.record_failure(urllib.parse.urlsplit(url).hostname, reason)
+            if self.pack_writer:
+                self.pack_writer.add_missing(url, reason)
+            return None
+
+    def _fetch_with_retries(self, url, cache_entry, to_file):
+        """按主机策略发送请求，临时错误时退避重试，主机熔断时直接失败
+
+        取消时抛出 Cancelled，不计入主机的失败次数；超过 asset_deadline 时先按超时记入主机策略，再抛出 AssetTimeout。
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        deadline = time.monotonic() + self.asset_deadline if self.asset_deadline else None
+        attempt = 0
+        while True:
+            self.cancel_token.check()
+            self.host_policy.before_request(host, url)
+            try:
+                content = self._fetch_network(url, cache_entry, to_file, deadline)
+            except Exception as e:
+                # 取消时中断传输引起的错误不是主机的问题
+                self.cancel_token.check()
+                # 超过截止时间的请求同样计入熔断器，探测请求也在这里结束
+                delay = self.host_policy.record_failure(host, url, e, attempt)
+                if isinstance(e, AssetTimeout):
+                    raise
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise AssetTimeout(f"下载超过 {self.asset_deadline} 秒的截止时间: {str(e)}") from e
+                if delay is None:
+                    raise
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise AssetTimeout(f"重试前将超过 {self.asset_deadline} 秒的截止时间: {str(e)}") from e
+                logger.warning(f"下载出错，{delay:.1f} 秒后重试 ({attempt + 1}/{self.host_policy.retries}) {url}: {str(e)}")
+                self.metrics.count('retries')
+                self.cancel_token.sleep(delay)
+                attempt += 1
+                continue
+            self.host_policy.record_success(host)
+            return content
+
+    def _fetch_network(self, url, cache_entry, to_file, deadline=None):
+        """从网络下载一次，出错时抛出异常；deadline 为单个资源的截止时刻（time.monotonic）"""
+        logger.info(f"开始下载: {url}")
+        
+        # 通过共享连接池流式下载，允许重定向；有缓存时发送条件请求
+        headers = self.cache.conditional_headers(cache_entry) if cache_entry else None
+        response = self.transport.get(url, headers=headers, stream=True, timeout=self._request_timeout(deadline))
+        if response.status_code == 304 and cache_entry:
+            response.close()
+            content = self._read_cached(cache_entry, to_file, url)
+            if content is not None:
+                self.cache.revalidate(cache_entry, response.headers)
+                logger.info(f"缓存验证未修改: {url}")
+                self.metrics.count('cache_revalidated')
+                return content
+            # 缓存内容已丢失，重新完整下载
+            response = self.transport.get(url, stream=True, timeout=self._request_timeout(deadline))
+        
+        with response:
             response.raise_for_status()
+            # 从发出请求到解析完响应头的时间
+            self.metrics.observe('ttfb', response.elapsed.total_seconds())
             
             # 检查Content-Type
             content_type = response.headers.get('Content-Type', '')
-            if 'font' in content_type or any(ext in url.lower() for ext in ['.woff', '.woff2', '.ttf', '.eot']):
+            if 'font' in content_type or any(ext in url.lower() for ext in self.FONT_EXTENSIONS):
                 logger.info(f"下载字体文件: {url}")
             
             # 获取最终URL（处理重定向后）
@@ -140,92 +663,411 @@ class ResourceLocalizer:
             if final_url != url:
                 logger.info(f"URL重定向: {url} -> {final_url}")
             
-            # 获取内容编码
+            # 压缩内容（gzip/deflate/br）在读取时已由连接池自动解压
             content_encoding = response.headers.get('Content-Encoding', '')
-            content = response.content
-            
-            # 解压缩内容
             if content_encoding:
                 logger.info(f"检测到压缩内容: {content_encoding}")
-                content = self.decompress_content(content, content_encoding)
             
-            logger.success(f"下载成功: {final_url}")
-            return content
-        except Exception as e:
-            logger.error(f"下载失败 {url}: {str(e)}")
+            # 超过大小限制时不读取响应体
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and not content_encoding:
+                self._check_size(int(content_length))
+            
+            chunks = self._guarded(response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE), deadline)
+            if to_file:
+                content = self._spool(chunks, content_type, final_url)
+                if self.cache:
+                    self.cache.record_miss()
+                    self.cache.store_file(url, content.path, content.digest, content.size, response.headers)
+            else:
+                content = Resource(self._read_chunks(chunks), content_type, final_url)
+                if self.cache:
+                    self.cache.record_miss()
+                    self.cache.store(url, content.content, response.headers)
+            # 解压前从网络读取的字节数和解压后的字节数
+            self.metrics.count('downloads')
+            self.metrics.count('bytes_wire', response.raw.tell())
+            self.metrics.count('bytes_in', content.size if to_file else len(content.content))
+        
+        logger.success(f"下载成功: {final_url}")
+        return content
+
+    def fetch_all(self, urls, stream_urls=None):
+        """下载一组URL，返回 {url: content}；max_workers 大于 1 时并发下载
+
+        stream_urls 中的URL流式下载到临时文件，对应的结果为 StreamedFile
+        """
+        stream_urls = set(stream_urls or ())
+        unique_urls = list(dict.fromkeys(url for url in urls if url))
+        if self.max_workers <= 1 or len(unique_urls) <= 1:
+            return {url: self.fetch(url, url in stream_urls) for url in unique_urls}
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='localizer')
+        logger.info(f"并发下载 {len(unique_urls)} 个资源，工作线程数: {self.max_workers}")
+        results = self._executor.map(lambda url: self.fetch(url, url in stream_urls), unique_urls)
+        return dict(zip(unique_urls, results))
+
+    def fetch(self, url, stream=False):
+        """下载单个URL，同一URL的并发请求只下载一次；已取消时线程池中排队的任务直接抛出 Cancelled"""
+        self.cancel_token.check()
+        download = self.download_to_file if stream else self.download_resource
+        return self._fetch_flight.do((url, stream), download, url)
+
+    def close(self):
+        """写完待写入的文件，释放下载线程池、文件镜像线程池和HTTP连接池
+
+        已取消时线程池中尚未开始的任务直接丢弃。
+        """
+        cancelled = self.cancel_token.cancelled
+        self.writer.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=cancelled)
+            self._executor = None
+        self.mirror.close(cancel=cancelled)
+        self.cancel_token.close()
+        self.transport.close()
+        if self.pack_writer:
+            self.pack_writer.close()
+        if self.pack:
+            self.pack.close()
+        # 清理未被使用的临时下载文件
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        if self.cache:
+            self.cache.evict()
+            self.cache.close()
+
+    def get_run_report(self):
+        """返回本次运行的统计报告"""
+        report = {
+            'output_dir': str(self.output_dir),
+            'run': dict(self.run_state, pending_pages=list(self.run_state['pending_pages'])),
+            'connections': self.transport.stats.snapshot()
+        }
+        if self.cache:
+            report['cache'] = dict(self.cache.stats)
+        report['content_store'] = self.content_store.get_stats()
+        report['mirror'] = self.mirror.get_stats()
+        report['writer'] = self.writer.get_stats()
+        report['css_graph'] = self.css_graph.to_dict()
+        report['metrics'] = self.metrics.to_dict()
+        report['hosts'] = self.host_policy.to_dict()
+        if self.precompressor:
+            report['postprocess'] = self.precompressor.get_stats()
+        if self.pack:
+            report['pack'] = self.pack.get_stats()
+        if self.pack_writer:
+            report['export_pack'] = dict(self.pack_writer.stats, path=str(self.pack_writer.path),
+                                         missing=dict(self.pack_writer.missing))
+        if self.profiler:
+            report['profile'] = self.profiler.to_dict()
+        return report
+
+    def write_reports(self):
+        """按配置写出JSON运行报告和 Prometheus textfile"""
+        if not self.report_path and not self.prometheus_path:
+            return
+        report = self.get_run_report()
+        if self.report_path:
+            write_json_report(self.report_path, report)
+            logger.info(f"运行报告已保存: {self.report_path}")
+        if self.prometheus_path:
+            write_prometheus_textfile(self.prometheus_path, report)
+            logger.info(f"Prometheus 指标已保存: {self.prometheus_path}")
+
+    def _charset_from_content_type(self, content_type):
+        if not content_type:
             return None
+        for param in content_type.split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'charset':
+                return value.strip().strip('"\'') or None
+        return None
+
+    def _declared_charsets(self, content, content_type):
+        """依次返回响应头、BOM 和 CSS @charset 声明的编码"""
+        yield self._charset_from_content_type(content_type), '响应头'
+        for bom, encoding in self.BOM_ENCODINGS:
+            if content.startswith(bom):
+                yield encoding, 'BOM'
+                break
+        match = self.CSS_CHARSET_PATTERN.match(content)
+        if match:
+            yield match.group(1).decode('ascii'), '@charset'
 
-    def decode_content(self, content, url):
-        """智能解码内容"""
+    def _try_decode(self, content, encoding):
+        try:
+            codecs.lookup(encoding)
+            return content.decode(encoding)
+        except (LookupError, UnicodeDecodeError):
+            return None
+
+    def decode_content(self, content, url, content_type=None):
+        """智能解码内容
+
+        依次尝试响应头中的 charset、BOM、CSS 的 @charset 声明和 UTF-8，
+        都失败时用 chardet 检测开头的一段样本；检测结果按URL记录。
+        检测出的编码无法解码全文时尝试常见编码，最后用替换字符代替无法解码的字节。
+        """
+        encoding = self.charsets.get(url)
+        if encoding:
+            text = self._try_decode(content, encoding)
+            if text is not None:
+                return text
+        
+        for encoding, source in self._declared_charsets(content, content_type):
+            if not encoding:
+                continue
+            text = self._try_decode(content, encoding)
+            if text is not None:
+                logger.debug(f"使用{source}声明的编码 {encoding} 解码 {url}")
+                self.charsets[url] = encoding
+                return text
+        
         try:
             # 尝试UTF-8解码
-            return content.decode('utf-8')
+            text = content.decode('utf-8')
+            self.charsets[url] = 'utf-8'
+            return text
         except UnicodeDecodeError:
-            try:
-                # 使用chardet检测编码
-                detected = chardet.detect(content)
-                encoding = detected['encoding']
-                if encoding:
-                    logger.info(f"检测到编码 {encoding} 用于 {url}")
-                    return content.decode(encoding)
-                else:
-                    # 如果无法检测编码，尝试其他常见编码
-                    for encoding in ['latin1', 'iso-8859-1', 'gbk', 'gb2312']:
-                        try:
-                            return content.decode(encoding)
-                        except UnicodeDecodeError:
-                            continue
-                    raise
-            except Exception as e:
-                logger.error(f"解码失败 {url}: {str(e)}")
-                # 如果所有解码都失败，返回原始内容
-                return content
+            pass
+        
+        encoding = self._detect_charset(content)
+        if encoding:
+            logger.info(f"检测到编码 {encoding} 用于 {url}")
+            text = self._try_decode(content, encoding)
+            if text is not None:
+                self.charsets[url] = encoding
+                return text
+            logger.warning(f"检测到的编码 {encoding} 无法解码全文 {url}")
+        
+        # 检测失败或检测结果不对时，尝试其他常见编码
+        for encoding in ['latin1', 'iso-8859-1', 'gbk', 'gb2312']:
+            text = self._try_decode(content, encoding)
+            if text is not None:
+                self.charsets[url] = encoding
+                return text
+        logger.error(f"解码失败 {url}，无法解码的字节以替换字符代替")
+        return content.decode('utf-8', errors='replace')
 
-    def process_css_content(self, css_content, css_url):
-        """处理CSS内容中的相对路径资源"""
+    def _detect_charset(self, content):
+        """用 chardet 检测编码，无法检测时返回None
+
+        按 CHARSET_SAMPLE_SIZE 分段送入检测器，有把握时提前结束，最多只检测开头的 CHARSET_SAMPLE_CHUNKS 段；
+        样本之后才出现的字节使猜测出错时，由调用方改用常见编码。
+        """
+        from chardet import UniversalDetector
+        detector = UniversalDetector()
+        sample_end = min(len(content), self.CHARSET_SAMPLE_SIZE * self.CHARSET_SAMPLE_CHUNKS)
+        for start in range(0, sample_end, self.CHARSET_SAMPLE_SIZE):
+            detector.feed(content[start:start + self.CHARSET_SAMPLE_SIZE])
+            if detector.done:
+                break
+        detector.close()
+        return detector.result['encoding']
+
+    def resolve_css_url(self, url, css_url):
+        """将CSS中引用的地址解析为完整URL，data URL、页面内锚点和非HTTP地址返回None"""
+        url = url.strip()
+        if not url or url.startswith(('data:', '#')):
+            return None
+        full_url = urllib.parse.urljoin(css_url, url)
+        if not full_url.startswith(('http://', 'https://')):
+            return None
+        return full_url
+
+    def css_asset_type(self, url):
+        """根据扩展名判断CSS引用资源的保存类型，无法识别时返回None"""
+        lower_url = url.lower()
+        if any(ext in lower_url for ext in self.FONT_EXTENSIONS):
+            return 'fonts'
+        if any(ext in lower_url for ext in self.IMAGE_EXTENSIONS):
+            return 'images'
+        return None
+
+    def _css_asset_urls(self, references, css_url):
+        urls = []
+        for reference in references:
+            if reference.kind == 'import':
+                continue
+            full_url = self.resolve_css_url(reference.url, css_url)
+            file_type = self.css_asset_type(reference.url)
+            if full_url and file_type and (full_url, file_type) not in self.asset_results:
+                urls.append(full_url)
+        return urls
+
+    def collect_css_urls(self, css_content, css_url):
+        """收集CSS内容中尚未处理过、需要下载的字体和图片URL"""
+        if not isinstance(css_content, str):
+            return []
+        return self._css_asset_urls(scan_css_references(css_content), css_url)
+
+    def load_stylesheets(self, css_urls, contents=None):
+        """按 @import 关系逐层下载并解析样式表，返回 {url: (css_text, references)}
+
+        contents 为已下载的 {url: Resource}；同一层的样式表并发下载，下载或解码失败的样式表记为失败。
+        """
+        contents = dict(contents or {})
+        stylesheets = {}
+        frontier = [url for url in dict.fromkeys(css_urls) if (url, 'css') not in self.asset_results]
+        while frontier:
+            contents.update(self.fetch_all([url for url in frontier if url not in contents]))
+            next_frontier = []
+            for url in frontier:
+                if url in stylesheets:
+                    continue
+                resource = contents.get(url)
+                css_text = None
+                if resource and resource.content:
+                    with self.metrics.phase('decode'):
+                        css_text = self.decode_content(resource.content, url, resource.content_type)
+                if not isinstance(css_text, str):
+                    self.asset_results[(url, 'css')] = None
+                    continue
+                # 样式表统一以UTF-8保存，去掉BOM并改写原有的 @charset 声明
+                css_text = self.CSS_CHARSET_TEXT_PATTERN.sub('@charset "UTF-8";', css_text.lstrip('\ufeff'), count=1)
+                
+                references = scan_css_references(css_text)
+                stylesheets[url] = (css_text, references)
+                for reference in references:
+                    if reference.kind != 'import':
+                        continue
+                    imported_url = self.resolve_css_url(reference.url, url)
+                    if imported_url and imported_url not in stylesheets and (imported_url, 'css') not in self.asset_results:
+                        next_frontier.append(imported_url)
+            frontier = list(dict.fromkeys(next_frontier))
+        return stylesheets
+
+    def localize_stylesheet(self, url, stylesheets=None, prefetched=None, visiting=None):
+        """本地化样式表及其导入的样式表，每个样式表只处理一次，返回保存的文件名，失败时返回None
+
+        stylesheets 为 load_stylesheets 的结果，缺少的样式表会按需下载；
+        visiting 为当前的导入链，用于检测循环导入。
+        """
+        key = (url, 'css')
+        if key in self.asset_results:
+            return self.asset_results[key]
+        
+        visiting = visiting if visiting is not None else []
+        if url in visiting:
+            cycle = visiting[visiting.index(url):] + [url]
+            self.css_graph.add_cycle(cycle)
+            logger.warning(f"检测到CSS循环导入: {' -> '.join(cycle)}")
+            return None
+        
+        stylesheets = stylesheets if stylesheets is not None else {}
+        if url not in stylesheets:
+            stylesheets.update(self.load_stylesheets([url]))
+            if url not in stylesheets:
+                self.asset_results[key] = None
+                return None
+        css_text, references = stylesheets.pop(url)
+        self.css_graph.add_node(url)
+        
+        visiting.append(url)
+        try:
+            processed_content = self.process_css_content(
+                css_text, url, prefetched, references=references, stylesheets=stylesheets, visiting=visiting
+            )
+        finally:
+            visiting.pop()
+        if self.minify_css:
+            processed_content = minify_css(processed_content)
+        
+        filename = self.save_file(processed_content.encode('utf-8'), url, 'css')
+        self.asset_results[key] = filename
+        self.css_graph.set_output(url, filename)
+        return filename
+
+    def process_css_content(self, css_content, css_url, prefetched=None, references=None, stylesheets=None, visiting=None,
+                            relative_dirs=None):
+        """处理CSS内容中 url()、@import 和 image-set() 引用的资源
+
+        prefetched 为已预先下载的 {url: content}，命中时不再重复下载；
+        导入的样式表递归本地化，字体和图片保存到对应目录，其余引用保持不变；
+        relative_dirs 为改写后各类资源的路径前缀，默认相对于 static/css 目录。
+        """
+        with self.metrics.phase('css_rewrite'):
+            return self._rewrite_css_content(css_content, css_url, prefetched, references, stylesheets, visiting,
+                                             relative_dirs or self.CSS_RELATIVE_DIRS)
+
+    def _rewrite_css_content(self, css_content, css_url, prefetched, references, stylesheets, visiting, relative_dirs):
         logger.info(f"处理CSS文件: {css_url}")
-        # 提取CSS中的url引用
-        url_pattern = r'url\([\'"]?(.*?)[\'"]?\)'
-        base_url = urllib.parse.urljoin(css_url, '.')
+        prefetched = prefetched or {}
+        if references is None:
+            references = scan_css_references(css_content)
         
-        def replace_url(match):
-            url = match.group(1)
+        def local_reference(reference, file_type, filename):
+            local_path = f'{relative_dirs[file_type]}/{filename}'
+            if file_type != 'css':
+                local_path = self.inline_asset(file_type, filename) or local_path
+            if css_content[reference.start] in '"\'':
+                return f'"{local_path}"'
+            return f'url("{local_path}")'
+        
+        def replace_reference(reference):
+            url = reference.url.strip()
             if url.startswith('data:'):
                 # 处理data URL
-                result = self.process_data_url(url)
-                if result:
-                    content, filename = result
-                    self.save_file(content, f"data_url_{filename}", 'images')
-                    return f'url("./images/{filename}")'
-                return match.group(0)
+                key = (url, 'images')
+                if key not in self.asset_results:
+                    result = self.process_data_url(url)
+                    self.asset_results[key] = self.save_file(result[0], result[1], 'images') if result else None
+                filename = self.asset_results[key]
+                return local_reference(reference, 'images', filename) if filename else None
             
-            if url.startswith(('http://', 'https://')):
-                return match.group(0)
+            full_url = self.resolve_css_url(url, css_url)
+            if not full_url:
+                return None
             
-            # 处理相对路径
-            full_url = urllib.parse.urljoin(base_url, url)
-            content = self.download_file(full_url)
-            if not content:
-                return match.group(0)
+            if reference.kind == 'import':
+                self.css_graph.add_import(css_url, full_url)
+                filename = self.localize_stylesheet(full_url, stylesheets, prefetched, visiting)
+                return local_reference(reference, 'css', filename) if filename else None
             
-            # 根据文件类型保存到相应目录
-            if any(ext in url.lower() for ext in ['.woff', '.woff2', '.ttf', '.eot']):
-                filename = self.save_file(content, full_url, 'fonts')
-                return f'url("./fonts/{filename}")'
-            elif any(ext in url.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico']):
-                filename = self.save_file(content, full_url, 'images')
-                return f'url("./images/{filename}")'
-            else:
-                return match.group(0)
+            # 只下载字体和图片
+            file_type = self.css_asset_type(url)
+            if not file_type:
+                return None
+            
+            self.css_graph.add_asset(css_url, full_url)
+            key = (full_url, file_type)
+            if key not in self.asset_results:
+                content = prefetched[full_url] if full_url in prefetched else self.fetch(full_url, stream=True)
+                self.asset_results[key] = self.save_file(content, full_url, file_type) if content else None
+            filename = self.asset_results[key]
+            return local_reference(reference, file_type, filename) if filename else None
         
-        return re.sub(url_pattern, replace_url, css_content)
+        return rewrite_css(css_content, references, replace_reference)
+
+    def get_save_dir(self, file_type):
+        """根据文件类型选择保存目录"""
+        if file_type == 'css':
+            return self.css_dir
+        elif file_type == 'js':
+            return self.js_dir
+        elif file_type == 'fonts':
+            return self.fonts_dir
+        elif file_type == 'images':
+            return self.images_dir
+        elif file_type == 'media':
+            return self.media_dir
+        return self.static_dir
 
     def save_file(self, content, original_url, file_type):
+        """保存资源文件，content 为字节或流式下载得到的 StreamedFile，返回保存的文件名
+
+        文件名立即确定并返回，内容在后台写入线程中按 sha256 写入内容存储，每份内容只保存一次，
+        文件名通过硬链接指向它；读取刚保存的文件前需调用 self.writer.wait。
+        """
+        streamed = isinstance(content, StreamedFile)
+        content_hash = content.digest if streamed else self.get_file_hash(content)
+        
         # 从URL中提取文件名
         if isinstance(original_url, str):
             filename = os.path.basename(urllib.parse.urlparse(original_url).path)
             if not filename:
-                filename = f"file_{self.get_file_hash(content)}.{file_type}"
+                filename = f"file_{self.short_hash(content_hash)}.{file_type}"
         else:
             filename = original_url
         
@@ -238,107 +1080,558 @@ class ResourceLocalizer:
                 filename = f"{name}_v{version}{ext}"
         
         # 检查文件是否已存在
-        if filename in self.downloaded_files:
-            if self.downloaded_files[filename] == self.get_file_hash(content):
-                logger.debug(f"文件已存在，跳过: {filename}")
-                return filename
+        if filename in self.downloaded_files and self.downloaded_files[filename] != content_hash:
+            # 如果内容不同，添加哈希后缀
+            name, ext = os.path.splitext(filename)
+            filename = f"{name}_{self.short_hash(content_hash)}{ext}"
+        
+        save_path = self.get_save_dir(file_type) / filename
+        if self.downloaded_files.get(filename) == content_hash and (save_path in self._saved_paths or save_path.exists()):
+            logger.debug(f"文件已存在，跳过: {filename}")
+            # 同一临时文件已交给写入线程时由它处理
+            if streamed and content.path not in self._stored_spools:
+                content.path.unlink(missing_ok=True)
+            return filename
+        size = content.size if streamed else len(content)
+        if streamed:
+            self._stored_spools.add(content.path)
+        
+        def store(path):
+            # 同一URL作为多种类型保存时共用一个临时文件，先移入存储的一次保存，其余的直接链接
+            if streamed:
+                # 临时文件已写完，移入内容存储
+                self.content_store.put_file(content_hash, content.path, content.size)
             else:
-                # 如果内容不同，添加哈希后缀
-                name, ext = os.path.splitext(filename)
-                filename = f"{name}_{self.get_file_hash(content)}{ext}"
+                self.content_store.put_bytes(content_hash, content)
+            self.content_store.link(content_hash, path)
+            return size
+        self.writer.run(save_path, store)
+        self._saved_paths.add(save_path)
+        self.metrics.count('files_written')
+        self.metrics.count('bytes_out', size)
+        
+        self.downloaded_files[filename] = content_hash
+        logger.info(f"保存文件: {save_path}")
+        return filename
+
+    def localize_references(self, references, page=None):
+        """下载并保存一个页面引用的资源，返回 {(url, file_type): 本地路径}
+
+        references 为页面的引用列表，类型为 style 的项是内联CSS，经 process_css_content 改写后
+        以 {(CSS文本, 'style'): 改写后的CSS} 返回；page 为页面路径，用于解析内联CSS中的相对地址。
+        """
+        inline_styles = list(dict.fromkeys(css for css, file_type in references if file_type == INLINE_STYLE))
+        assets = list(dict.fromkeys(reference for reference in references if reference[1] != INLINE_STYLE))
+        page_url = str(page) if page else ''
+        
+        # 先下载本次运行中尚未处理过的资源，样式表需要改写，其余资源流式写入临时文件
+        pending_urls = [url for url, file_type in assets if (url, file_type) not in self.asset_results]
+        contents = self.fetch_all(
+            pending_urls,
+            stream_urls=[url for url, file_type in assets if file_type != 'css']
+        )
+        css_urls = [url for url, file_type in assets if file_type == 'css']
+        
+        # 按 @import 关系加载样式表，并下载其中和内联CSS中引用的字体和图片
+        stylesheets = self.load_stylesheets(css_urls, contents)
+        sub_urls = [
+            sub_url
+            for url, (_, css_references) in stylesheets.items()
+            for sub_url in self._css_asset_urls(css_references, url)
+        ]
+        sub_urls.extend(sub_url for css in inline_styles for sub_url in self.collect_css_urls(css, page_url))
+        # 页面中直接引用的图片和字体已经下载，先保存，样式表中的同一资源不再重复下载
+        sub_urls = [url for url in dict.fromkeys(sub_urls) if url not in contents]
+        sub_contents = self.fetch_all(sub_urls, stream_urls=sub_urls)
+
+        # 脚本、图片、字体和媒体文件直接保存
+        for url, file_type in assets:
+            key = (url, file_type)
+            if file_type != 'css' and key not in self.asset_results and url in contents:
+                content = contents[url]
+                self.asset_results[key] = self.save_file(content, url, file_type) if content else None
         
-        # 根据文件类型选择保存目录
+        replacements = {}
+        for url, file_type in assets:
+            key = (url, file_type)
+            if file_type == 'css':
+                self.localize_stylesheet(url, stylesheets, sub_contents)
+            if self.asset_results.get(key):
+                replacements[key] = f'{self.HTML_RELATIVE_DIRS[file_type]}/{self.asset_results[key]}'
+        
+        # 内联CSS中的地址相对于页面
+        for css in inline_styles:
+            processed = self.process_css_content(
+                css, page_url, sub_contents, stylesheets=stylesheets, relative_dirs=self.HTML_RELATIVE_DIRS
+            )
+            if processed != css:
+                replacements[(css, INLINE_STYLE)] = processed
+        return replacements
+
+    def bundle_references(self, groups, replacements):
+        """把每组相邻的样式表或脚本合并为一个文件，返回 {引用组: 合并文件的本地路径}
+
+        组内有下载失败的引用时不合并；成员相同的组共用同一个合并文件。
+        """
+        bundles = {}
+        for group in groups:
+            local_paths = [replacements.get(reference) for reference in group]
+            if not all(local_paths) or any(path.startswith('data:') for path in local_paths):
+                continue
+            file_type = group[0][1]
+            key = (file_type,) + tuple(os.path.basename(path) for path in local_paths)
+            if key not in self.bundle_results:
+                with self.metrics.phase('bundle'):
+                    self.bundle_results[key] = self._build_bundle(file_type, key[1:])
+            if self.bundle_results[key]:
+                bundles[group] = f'./static/{file_type}/{self.bundle_results[key]}'
+        return bundles
+
+    def _build_bundle(self, file_type, filenames):
+        """按顺序拼接已保存的文件，保存合并文件并返回文件名，无法安全合并时返回None"""
         if file_type == 'css':
-            save_path = self.css_dir / filename
-        elif file_type == 'js':
-            save_path = self.js_dir / filename
-        elif file_type == 'fonts':
-            save_path = self.fonts_dir / filename
-        elif file_type == 'images':
-            save_path = self.images_dir / filename
+            parts = [self._flatten_stylesheet(filename, []) for filename in filenames]
+            if any(part is None for part in parts):
+                return None
+            content = '@charset "UTF-8";\n' + '\n'.join(parts)
+            if self.minify_css:
+                content = minify_css(content)
+            content = content.encode('utf-8')
         else:
-            save_path = self.static_dir / filename
-        
-        with open(save_path, 'wb') as f:
-            f.write(content)
+            parts = [self.read_output(self.js_dir / filename) for filename in filenames]
+            # "use strict" 指令合并后会作用于整个文件
+            if any(self.USE_STRICT_PATTERN.match(part) for part in parts):
+                logger.debug(f"脚本使用了 use strict，不合并: {', '.join(filenames)}")
+                return None
+            content = b'\n;\n'.join(part.rstrip() for part in parts) + b'\n'
         
-        self.downloaded_files[filename] = self.get_file_hash(content)
-        logger.info(f"保存文件: {save_path}")
+        filename = self.save_file(content, f"bundle_{self.short_hash(self.get_file_hash(content))}.{file_type}", file_type)
+        self.metrics.count('bundles_written')
+        logger.info(f"合并 {len(filenames)} 个文件为 {filename}: {', '.join(filenames)}")
         return filename
 
+    def _flatten_stylesheet(self, filename, visiting):
+        """返回展开了 @import 的样式表内容，导入的文件不在本地或带有 layer/supports 条件时返回None
+
+        合并文件中只有开头的 @import 有效，因此把导入的样式表内容放到原位置，带媒体查询的用 @media 包裹。
+        """
+        css = self.read_output(self.css_dir / filename).decode('utf-8')
+        css = self.CSS_CHARSET_TEXT_PATTERN.sub('', css, count=1)
+        if self.CSS_NAMESPACE_PATTERN.search(css):
+            return None
+        
+        parts = []
+        last = 0
+        for reference in scan_css_references(css):
+            if reference.kind != 'import':
+                continue
+            start = css.lower().rfind('@import', last, reference.start)
+            target = reference.url.strip()
+            target = target[2:] if target.startswith('./') else target
+            if start < 0 or css[start + len('@import'):reference.start].strip() or '/' in target or ':' in target:
+                return None
+            end = css.find(';', reference.end)
+            end = len(css) if end < 0 else end + 1
+            media = css[reference.end:end].rstrip(';').strip()
+            if re.search(r'\b(?:layer|supports)\b', media, re.IGNORECASE):
+                return None
+            
+            parts.append(css[last:start])
+            last = end
+            if target in visiting or target == filename:
+                # 循环导入，浏览器同样会忽略
+                continue
+            imported = self._flatten_stylesheet(target, visiting + [filename])
+            if imported is None:
+                return None
+            parts.append(f'@media {media}{{\n{imported}\n}}' if media else imported)
+        parts.append(css[last:])
+        return ''.join(parts)
+
+    def read_output(self, path):
+        """读取本次运行保存的文件，等待其后台写入完成"""
+        self.writer.wait(path)
+        return Path(path).read_bytes()
+
+    def prepare_page_output(self, groups, replacements):
+        """按配置合并和内联页面引用的资源，replacements 会被原地修改，返回合并文件 {引用组: 本地路径}"""
+        bundles = self.bundle_references(groups, replacements) if self.bundle else {}
+        if self.inline_max_size:
+            self.inline_references(replacements, bundles)
+        return bundles
+
+    def inline_references(self, replacements, bundles):
+        """把不超过 inline_max_size 的页面资源和合并文件改为 data URL"""
+        for (url, file_type), local_path in replacements.items():
+            if file_type != INLINE_STYLE:
+                replacements[(url, file_type)] = self.inline_asset(file_type, os.path.basename(local_path)) or local_path
+        for group, local_path in bundles.items():
+            bundles[group] = self.inline_asset(group[0][1], os.path.basename(local_path)) or local_path
+
+    def get_html_output_path(self, html_file):
+        return self.output_dir / Path(html_file).relative_to(self.base_dir)
+
     def process_html_file(self, html_file):
+        """本地化HTML文件中的外部资源，返回输出路径，取消时返回None
+
+        只替换引用所在的属性值，其余内容原样保留；没有需要替换的引用时，页面直接镜像到输出目录。
+        处理过程中被取消时抛出 Cancelled，该页面不会写出。
+        """
         # 检查是否取消
-        if not self.check_cancel():
-            return
+        if self.is_cancelled():
+            return None
             
         logger.info(f"处理HTML文件: {html_file}")
-        with open(html_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        with self.metrics.phase('html_parse'):
+            document = open_html_document(html_file, self.parser)
+        try:
+            self.page_assets[html_file] = document.references
+            replacements = self.localize_references(self.page_assets[html_file], html_file)
+            bundles = self.prepare_page_output(document.bundle_groups(), replacements)
+        except BaseException:
+            document.close()
+            raise
+        return self._write_html(html_file, document, replacements, bundles)
+
+    def _write_html(self, html_file, document, replacements, bundles):
+        """提交改写后的页面给写入线程，没有需要替换的引用时镜像原页面，返回输出路径；document 写出后关闭"""
+        output_path = self.get_html_output_path(html_file)
+        try:
+            produce = document.prepare(replacements, bundles)
+        except BaseException:
+            document.close()
+            raise
+        if produce is None:
+            document.close()
+            return self._pass_through_html(html_file, output_path)
         
-        soup = BeautifulSoup(content, 'html.parser')
-        modified = False
+        def write_page(f):
+            # 页面在写入线程中写出后关闭
+            with document:
+                produce(f)
+        
+        def written(size):
+            self._record_html_output(output_path, size)
+            logger.success(f"保存修改后的HTML文件: {output_path}")
+        self.writer.write(output_path, write_page, on_done=written)
+        return output_path
 
-        # 处理CSS链接
-        for link in soup.find_all('link', rel='stylesheet'):
-            if link.get('href') and not link['href'].startswith(('http://', 'https://')):
-                continue
-            
-            url = link['href']
-            content = self.download_file(url)
-            if content:
-                # 处理CSS内容中的相对路径资源
-                decoded_content = self.decode_content(content, url)
-                processed_content = self.process_css_content(decoded_content, url)
-                filename = self.save_file(processed_content.encode('utf-8'), url, 'css')
-                link['href'] = f'./static/css/{filename}'
-                modified = True
-
-        # 处理JS脚本
-        for script in soup.find_all('script', src=True):
-            if not script['src'].startswith(('http://', 'https://')):
-                continue
+    def _record_html_output(self, output_path, size=None):
+        self.metrics.count('html_rewritten')
+        self.metrics.count('bytes_out', os.path.getsize(output_path) if size is None else size)
+
+    def _pass_through_html(self, html_file, output_path):
+        """不需要修改的页面按镜像方式输出，不解析也不重新写入内容"""
+        self.metrics.count('html_passed_through')
+        self.mirror.mirror(html_file, output_path)
+        return output_path
+
+    def process_html_files(self, html_files):
+        """处理一批HTML文件，返回 {html_file: 输出路径}
+
+        html_processes 大于 1 时，HTML的扫描和改写分布到多个进程中执行；
+        资源下载和文件名登记仍在当前进程中按文件顺序进行，保证输出文件名确定。
+        """
+        self._emit_progress('files_total', total=len(html_files))
+        self.run_state['pages_total'] = len(html_files)
+        outputs = self._process_html_files(html_files)
+        self.run_state['pages_done'] = len(outputs)
+        self.run_state['pending_pages'] = [
+            Path(html_file).relative_to(self.base_dir).as_posix() for html_file in html_files if html_file not in outputs
+        ]
+        return outputs
+
+    def _process_html_files(self, html_files):
+        if self.html_processes <= 1 or len(html_files) <= 1:
+            outputs = {}
+            for html_file in html_files:
+                try:
+                    output_path = self.process_html_file(html_file)
+                except Cancelled:
+                    # 处理到一半的页面不写出，下次运行时重新处理
+                    self.page_assets.pop(html_file, None)
+                    break
+                if output_path is None:
+                    break
+                outputs[html_file] = output_path
+                self._emit_progress('file_done', path=str(html_file), done=len(outputs))
+            return outputs
+        
+        logger.info(f"使用 {self.html_processes} 个进程解析 {len(html_files)} 个HTML文件")
+        chunksize = max(1, len(html_files) // (self.html_processes * 4))
+        outputs = {}
+        with ProcessPoolExecutor(max_workers=self.html_processes) as pool:
+            # 并行扫描，收集每个页面引用的资源
+            scanned = pool.map(scan_html_file, html_files, [self.parser] * len(html_files), chunksize=chunksize)
+            page_replacements = []
+            try:
+                for html_file, (references, groups) in zip(html_files, scanned):
+                    if self.is_cancelled():
+                        break
+                    logger.info(f"处理HTML文件: {html_file}")
+                    self.page_assets[html_file] = references
+                    replacements = self.localize_references(references, html_file)
+                    bundles = self.prepare_page_output(groups, replacements)
+                    page_replacements.append((html_file, replacements, bundles))
+                    self._emit_progress('file_done', path=str(html_file), done=len(page_replacements))
+            except Cancelled:
+                self.page_assets.pop(html_file, None)
             
-            url = script['src']
-            content = self.download_file(url)
-            if content:
-                filename = self.save_file(content, url, 'js')
-                script['src'] = f'./static/js/{filename}'
-                modified = True
-
-        if modified:
-            # 创建输出目录结构
-            relative_path = html_file.relative_to(self.base_dir)
-            output_path = self.output_dir / relative_path
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+            if self.cancel_token.cancelled:
+                # 丢弃尚未开始的扫描，已完成本地化的页面在当前进程中写出
+                pool.shutdown(wait=False, cancel_futures=True)
+                for html_file, replacements, bundles in page_replacements:
+                    outputs[html_file] = self._write_html(html_file, open_html_document(html_file, self.parser),
+                                                          replacements, bundles)
+                return outputs
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(str(soup))
-            logger.success(f"保存修改后的HTML文件: {output_path}")
+            # 并行改写并写入HTML，输出目录由当前进程按目录缓存创建
+            futures = []
+            for html_file, replacements, bundles in page_replacements:
+                if not replacements:
+                    continue
+                output_path = self.get_html_output_path(html_file)
+                self.writer.ensure_dir(output_path.parent)
+                futures.append((html_file, pool.submit(rewrite_html_file, html_file, output_path, replacements,
+                                                       self.parser, bundles, self.writer.fsync_files)))
+            for html_file, future in futures:
+                outputs[html_file] = future.result()
+                if outputs[html_file]:
+                    self.writer.record_external(outputs[html_file])
+                    self._record_html_output(outputs[html_file])
+                    logger.success(f"保存修改后的HTML文件: {outputs[html_file]}")
+            for html_file, _, _ in page_replacements:
+                if not outputs.get(html_file):
+                    outputs[html_file] = self._pass_through_html(html_file, self.get_html_output_path(html_file))
+        return {html_file: outputs[html_file] for html_file, _, _ in page_replacements}
 
     def process_directory(self):
+        """处理整个目录，完整完成时返回True
+
+        被取消或超过 deadline 时返回False：已完成的页面和资源保留在输出目录中，
+        未处理的页面记录在运行报告的 run 部分，增量模式下再次运行会从中断处继续。
+        """
         logger.info(f"开始处理目录: {self.base_dir}")
-        for root, _, files in os.walk(self.base_dir):
-            # 检查是否取消
-            if not self.check_cancel():
-                return
-                
-            for file in files:
+        if self.deadline:
+            self.cancel_token.set_deadline(self.deadline)
+        if self.profiler:
+            self.profiler.start()
+        completed = False
+        try:
+            # 取消时立即中断所有正在进行的HTTP传输
+            with self.cancel_token.on_cancel(self.transport.abort):
+                completed = self._walk_directory()
+                if completed and self.precompressor:
+                    self.precompressor.run(self.static_dir)
+        except Cancelled:
+            completed = False
+        finally:
+            self.run_state['completed'] = completed
+            self.run_state['cancelled'] = self.cancel_token.reason
+            if self.profiler:
+                self.profiler.stop()
+            if self.incremental:
+                self.save_manifest()
+            self.close()
+            self.write_reports()
+        
+        if not completed:
+            self._log_partial_progress()
+            return False
+        
+        report = self.get_run_report()
+        connections = report['connections']
+        logger.info(f"HTTP请求 {connections['requests']} 次，新建连接 {connections['connections']} 个，复用连接 {connections['reused']} 次")
+        mirror = report['mirror']
+        logger.info(f"镜像文件 {mirror['files']} 个，复制 {mirror['bytes_copied']} 字节，避免复制 {mirror['bytes_avoided']} 字节")
+        logger.success(f"处理完成，输出目录: {self.output_dir}")
+        return True
+
+    def _log_partial_progress(self):
+        state = self.run_state
+        reason = '超过截止时间' if state['cancelled'] == DEADLINE else '已取消'
+        if state['walk_completed']:
+            logger.warning(f"运行{reason}：已完成 {state['pages_done']}/{state['pages_total']} 个页面，"
+                           f"未处理 {len(state['pending_pages'])} 个")
+        else:
+            logger.warning(f"运行{reason}：目录遍历未完成")
+        if self.incremental:
+            logger.info(f"以增量模式再次运行将从中断处继续，输出目录: {self.output_dir}")
+        else:
+            logger.info("需要从中断处继续时，请使用增量模式（incremental）并指定相同的输出目录")
+
+    def load_manifest(self):
+        """读取上次运行的清单，恢复文件名登记和资源结果，返回上次的文件清单"""
+        manifest_path = self.output_dir / self.MANIFEST_NAME
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取清单失败，将完整处理: {str(e)}")
+            return {}
+        if manifest.get('version') != self.MANIFEST_VERSION:
+            return {}
+        
+        # 清单中的文件名不记录类型，只登记仍然存在于某个资源目录中的文件，已删除的文件会重新保存
+        save_dirs = [self.get_save_dir(file_type) for file_type in ('css', 'js', 'fonts', 'images', 'media', None)]
+        for filename, content_hash in manifest.get('downloaded_files', {}).items():
+            if any((save_dir / filename).exists() for save_dir in save_dirs):
+                self.downloaded_files[filename] = content_hash
+        for url, file_type, filename in manifest.get('assets', []):
+            # 只复用输出目录中仍然存在的资源
+            if filename and (self.get_save_dir(file_type) / filename).exists():
+                self.asset_results.setdefault((url, file_type), filename)
+        logger.info(f"读取清单: {manifest_path}")
+        return manifest.get('files', {})
+
+    def save_manifest(self):
+        """保存本次运行的清单，供下次增量运行使用"""
+        manifest = {
+            'version': self.MANIFEST_VERSION,
+            'files': self.manifest_files,
+            'assets': [
+                [url, file_type, filename]
+                for (url, file_type), filename in self.asset_results.items()
+                if filename
+            ],
+            'downloaded_files': self.downloaded_files
+        }
+        manifest_path = self.output_dir / self.MANIFEST_NAME
+        data = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+        write_atomic(manifest_path, lambda f: f.write(data))
+        logger.info(f"保存清单: {manifest_path}")
+
+    def _file_sha256(self, path):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _is_unchanged(self, path, stat, entry):
+        """判断源文件自上次运行后是否未变化，只在大小相同但修改时间不同时计算哈希"""
+        if entry.get('output') and not (self.output_dir / entry['output']).exists():
+            return False
+        if entry.get('size') != stat.st_size:
+            return False
+        if entry.get('mtime') == stat.st_mtime_ns:
+            return True
+        if entry.get('sha256') == self._file_sha256(path):
+            entry['mtime'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def _remove_output(self, relative_output):
+        output_path = self.output_dir / relative_output
+        try:
+            output_path.unlink()
+            logger.info(f"删除过期输出: {output_path}")
+        except FileNotFoundError:
+            pass
+
+    def _walk_directory(self):
+        previous = self.load_manifest() if self.incremental else {}
+        skipped = 0
+        html_jobs = []
+        # 已提交的镜像任务 [(future, manifest_key)]，取消时丢弃尚未开始的任务
+        mirror_jobs = []
+        with self.metrics.phase('walk'):
+            for root, _, files in os.walk(self.base_dir):
                 # 检查是否取消
-                if not self.check_cancel():
-                    return
+                if self.is_cancelled():
+                    return self._cancel_walk(previous, mirror_jobs)
+                
+                for file in files:
+                    # 检查是否取消
+                    if self.is_cancelled():
+                        return self._cancel_walk(previous, mirror_jobs)
+                
+                    source_path = Path(root) / file
+                    relative_path = source_path.relative_to(self.base_dir)
+                    manifest_key = relative_path.as_posix()
+                    stat = None
+                    if self.incremental:
+                        stat = source_path.stat()
+                        entry = previous.get(manifest_key)
+                        if entry and self._is_unchanged(source_path, stat, entry):
+                            self.manifest_files[manifest_key] = entry
+                            skipped += 1
+                            continue
                     
-                if file.endswith('.html'):
-                    html_path = Path(root) / file
-                    self.process_html_file(html_path)
-                else:
-                    # 复制非HTML文件
-                    relative_path = Path(root).relative_to(self.base_dir)
-                    output_path = self.output_dir / relative_path / file
-                    output_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(Path(root) / file, output_path)
-                    logger.debug(f"复制文件: {output_path}")
+                    if file.endswith('.html'):
+                        # HTML文件在遍历结束后统一处理
+                        html_jobs.append((source_path, manifest_key, stat))
+                    else:
+                        # 镜像非HTML文件，复制在后台线程中进行
+                        future = self.mirror.mirror(source_path, self.output_dir / relative_path)
+                        mirror_jobs.append((future, manifest_key))
+                        self._record_file(previous, manifest_key, source_path, stat, manifest_key, [])
+        self.run_state['walk_completed'] = True
         
-        logger.success(f"处理完成，输出目录: {self.output_dir}")
+        outputs = self.process_html_files([source_path for source_path, _, _ in html_jobs])
+        if self.cancel_token.cancelled:
+            self._cancel_mirror(mirror_jobs)
+        self.mirror.wait()
+        self.writer.flush()
+        for source_path, manifest_key, stat in html_jobs:
+            if source_path not in outputs:
+                continue
+            output_path = outputs[source_path]
+            output = output_path.relative_to(self.output_dir).as_posix() if output_path else None
+            self._record_file(previous, manifest_key, source_path, stat, output, self.page_assets.pop(source_path, []))
+        if len(outputs) < len(html_jobs):
+            return self._finish_walk(previous, completed=False)
+        
+        if self.incremental:
+            logger.info(f"增量模式跳过未变化的文件 {skipped} 个")
+        return self._finish_walk(previous, completed=True)
+
+    def _cancel_mirror(self, mirror_jobs):
+        """丢弃尚未开始的镜像任务，并从清单中移除对应的条目，下次运行时重新镜像"""
+        cancelled = 0
+        for future, manifest_key in mirror_jobs:
+            if future.cancel():
+                self.manifest_files.pop(manifest_key, None)
+                cancelled += 1
+        self.run_state['mirror_cancelled'] = cancelled
+
+    def _cancel_walk(self, previous, mirror_jobs):
+        """遍历中途取消：丢弃未开始的镜像任务，等待已开始的完成，保留未处理的清单条目"""
+        self._cancel_mirror(mirror_jobs)
+        self.mirror.wait()
+        return self._finish_walk(previous, completed=False)
+
+    def _record_file(self, previous, manifest_key, source_path, stat, output, assets):
+        """增量模式下记录已处理文件的清单条目"""
+        if not self.incremental:
+            return
+        # 之前有输出而本次不再需要时，删除旧的输出
+        old_output = previous.get(manifest_key, {}).get('output')
+        if old_output and old_output != output:
+            self._remove_output(old_output)
+        self.manifest_files[manifest_key] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'sha256': self._file_sha256(source_path),
+            'output': output,
+            'assets': [[url, file_type] for url, file_type in assets if file_type != INLINE_STYLE]
+        }
+
+    def _finish_walk(self, previous, completed):
+        """结束遍历：完整遍历后删除源文件已不存在的输出，取消时保留未处理的清单条目"""
+        if not self.incremental:
+            return completed
+        for manifest_key, entry in previous.items():
+            if manifest_key in self.manifest_files:
+                continue
+            if completed:
+                if entry.get('output'):
+                    self._remove_output(entry['output'])
+            else:
+                self.manifest_files[manifest_key] = entry
+        return completed
 
 def main():
     # 配置日志
@@ -359,8 +1652,8 @@ def main():
     
     try:
         localizer = ResourceLocalizer(base_dir, proxy)
-        localizer.process_directory()
-        logger.success("资源本地化完成！")
+        if localizer.process_directory():
+            logger.success("资源本地化完成！")
     except Exception as e:
         logger.error(f"处理过程中发生错误: {str(e)}")
         raise
@@ -0,0 +1,262 @@
+import os
+import queue
+import threading
+from pathlib import Path
+from concurrent.futures import Future
+from loguru import logger
+
+
+# fsync 策略：none 只依赖重命名的原子性（进程崩溃后输出一致，断电可能丢失最近写入的文件）；
+# file 在重命名前同步每个文件的内容；full 另外在 flush 时同步写入过文件的目录，每个目录只同步一次
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+
+def write_atomic(path, produce, fsync=False):
+    """把 produce(f) 写入的内容先写到同目录的临时文件，再原子替换为 path，返回写入的字节数
+
+    写入失败时删除临时文件，path 保持原样；输出文件可能是指向源文件的链接，因此总是替换而不是覆盖写入。
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            produce(f)
+            size = f.tell()
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return size
+
+
+def fsync_directory(path):
+    """同步目录项，使其中的重命名在断电后保留；不支持打开目录的平台上忽略"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _WriteJob:
+    __slots__ = ('path', 'func', 'on_done', 'future', 'previous')
+
+    def __init__(self, path, func, on_done, previous):
+        self.path = path
+        self.func = func
+        self.on_done = on_done
+        self.future = Future()
+        self.previous = previous
+
+
+class OutputWriter:
+    """输出文件的后台写入阶段
+
+    写入任务放入容量为 queue_size 的队列，由 workers 个线程依次执行，下载和解析不必等待磁盘；
+    队列满时提交方等待，避免未写出的内容占用过多内存。workers 为 0 时在提交的线程中直接写入。
+    - 已创建的目录会被记住，同一目录只调用一次 mkdir；
+    - 每个文件先写临时文件再重命名，取消或崩溃时不会留下写了一半的文件；
+    - 对同一路径的多次写入按提交顺序执行；读取刚提交的文件前调用 wait(path)；
+    - fsync 为 FSYNC_POLICIES 之一，metrics 不为空时写入耗时计入 write 阶段。
+    """
+
+    def __init__(self, workers=2, queue_size=64, fsync='none', metrics=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync}，可选 {', '.join(FSYNC_POLICIES)}")
+        self.workers = max(0, int(workers or 0))
+        self.fsync = fsync
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        # 登记和入队在同一把锁中进行，保证同一路径的写入按提交顺序入队
+        self._submit_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size or 1)))
+        self._threads = []
+        # 已确认存在的目录
+        self._dirs = set()
+        # 等待 full 策略同步的目录
+        self._dirty_dirs = set()
+        # 尚未完成的写入 {路径: 最后一次提交的 Future}
+        self._pending = {}
+        self._errors = []
+        self.stats = {
+            'jobs': 0, 'bytes': 0, 'failed': 0, 'queue_full': 0, 'max_queued': 0,
+            'dirs_created': 0, 'dir_cache_hits': 0, 'fsyncs': 0
+        }
+
+    @property
+    def fsync_files(self):
+        return self.fsync in ('file', 'full')
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _start(self):
+        """第一次提交时启动写入线程，调用时需持有锁"""
+        if self._threads or not self.workers:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'writer-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def ensure_dir(self, path):
+        """确保目录存在，已创建过的目录直接返回"""
+        path = Path(path)
+        with self._lock:
+            if path in self._dirs:
+                self.stats['dir_cache_hits'] += 1
+                return
+        path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self.stats['dirs_created'] += 1
+            # 上级目录也已存在
+            self._dirs.add(path)
+            self._dirs.update(path.parents)
+
+    def record_external(self, path):
+        """登记由其他进程写入的文件，full 策略下其目录在 flush 时同步"""
+        if self.fsync == 'full':
+            with self._lock:
+                self._dirty_dirs.add(Path(path).parent)
+
+    def write(self, path, produce, on_done=None):
+        """提交一个文件写入：produce(f) 向二进制文件对象写入内容，成功后在写入线程中调用 on_done(字节数)"""
+        fsync = self.fsync_files
+
+        def write_file(path):
+            size = write_atomic(path, produce, fsync)
+            if fsync:
+                self._count('fsyncs')
+            return size
+        return self._submit(path, write_file, on_done)
+
+    def run(self, path, func, on_done=None):
+        """提交一个自行保证原子性的输出操作（如创建硬链接），func(path) 返回写入的字节数"""
+        return self._submit(path, func, on_done)
+
+    def _submit(self, path, func, on_done):
+        path = Path(path)
+        with self._submit_lock:
+            with self._lock:
+                job = _WriteJob(path, func, on_done, self._pending.get(path))
+                self._pending[path] = job.future
+                self.stats['jobs'] += 1
+                self._start()
+            if not self.workers:
+                self._execute(job)
+                return job.future
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                # 写入跟不上时让提交方等待
+                self._count('queue_full')
+                if self.metrics is None:
+                    self._queue.put(job)
+                else:
+                    with self.metrics.phase('write_wait'):
+                        self._queue.put(job)
+            with self._lock:
+                self.stats['max_queued'] = max(self.stats['max_queued'], self._queue.qsize())
+        return job.future
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job):
+        if job.previous is not None:
+            # 同一路径之前提交的写入先完成
+            try:
+                job.previous.result()
+            except Exception:
+                pass
+        try:
+            if self.metrics is None:
+                size = self._write(job)
+            else:
+                with self.metrics.phase('write'):
+                    size = self._write(job)
+            job.future.set_result(size)
+        except Exception as e:
+            logger.error(f"写入文件失败 {job.path}: {str(e)}")
+            with self._lock:
+                self.stats['failed'] += 1
+                self._errors.append(e)
+            job.future.set_exception(e)
+        finally:
+            with self._lock:
+                if self._pending.get(job.path) is job.future:
+                    del self._pending[job.path]
+
+    def _write(self, job):
+        self.ensure_dir(job.path.parent)
+        size = job.func(job.path) or 0
+        with self._lock:
+            self.stats['bytes'] += size
+            if self.fsync == 'full':
+                self._dirty_dirs.add(job.path.parent)
+        if job.on_done is not None:
+            job.on_done(size)
+        return size
+
+    def wait(self, path):
+        """等待对 path 已提交的写入完成，写入失败时抛出其异常"""
+        with self._lock:
+            future = self._pending.get(Path(path))
+        if future is not None:
+            future.result()
+
+    def _finish(self):
+        """同步等待中的目录，返回并清空写入错误"""
+        with self._lock:
+            dirs = sorted(self._dirty_dirs)
+            self._dirty_dirs.clear()
+            errors = self._errors
+            self._errors = []
+        for path in dirs:
+            fsync_directory(path)
+        self._count('fsyncs', len(dirs))
+        return errors
+
+    def flush(self):
+        """等待已提交的写入全部完成，按策略同步目录，有写入失败时抛出第一个错误"""
+        if self._threads:
+            self._queue.join()
+        errors = self._finish()
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """写完队列中的文件并结束写入线程；写入错误已逐个记入日志并由 flush 抛出，这里不再抛出"""
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        self._finish()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(workers=self.workers, fsync=self.fsync)
+        return stats
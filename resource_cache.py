@@ -0,0 +1,214 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from collections import namedtuple
+from loguru import logger
+
+
+CacheEntry = namedtuple('CacheEntry', [
+    'url', 'digest', 'size', 'etag', 'last_modified', 'content_type', 'fetched_at'
+])
+
+
+class ResourceCache:
+    """跨运行的持久化资源缓存
+
+    索引按URL保存在 SQLite 中，内容按 sha256 存放在 blobs 目录下，相同内容只保存一份。
+    超过 ttl 秒的条目需要通过 If-None-Match / If-Modified-Since 重新验证；
+    缓存总大小超过 max_size 字节时按最近最少使用（LRU）淘汰。
+    offline 为 True 时只读缓存，不访问网络。
+    """
+
+    def __init__(self, cache_dir, ttl=86400, max_size=512 * 1024 * 1024, offline=False):
+        self.cache_dir = Path(cache_dir)
+        self.blobs_dir = self.cache_dir / 'blobs'
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.cache_dir / 'index.db'), timeout=30, check_same_thread=False)
+        # WAL 模式下多个进程共用同一个缓存时，读写互不阻塞
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                content_type TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self._db.commit()
+
+    def _blob_path(self, digest):
+        return self.blobs_dir / digest[:2] / digest
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def lookup(self, url):
+        """查找URL对应的缓存条目，内容文件丢失时视为未命中"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT url, digest, size, etag, last_modified, content_type, fetched_at FROM entries WHERE url = ?',
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        if not self._blob_path(entry.digest).exists():
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.fetched_at < self.ttl
+
+    def conditional_headers(self, entry):
+        """生成条件请求头"""
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def open(self, entry):
+        """打开缓存内容文件并更新访问时间，文件丢失时返回None"""
+        try:
+            f = open(self._blob_path(entry.digest), 'rb')
+        except OSError:
+            return None
+        with self._lock:
+            self._db.execute('UPDATE entries SET last_access = ? WHERE url = ?', (time.time(), entry.url))
+            self._db.commit()
+            self.stats['hits'] += 1
+        return f
+
+    def read(self, entry):
+        """读取缓存内容并更新访问时间"""
+        f = self.open(entry)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def revalidate(self, entry, headers):
+        """服务器返回 304 时刷新条目的获取时间"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'UPDATE entries SET fetched_at = ?, last_access = ?, etag = ?, last_modified = ? WHERE url = ?',
+                (now, now, headers.get('ETag') or entry.etag,
+                 headers.get('Last-Modified') or entry.last_modified, entry.url)
+            )
+            self._db.commit()
+            self.stats['revalidated'] += 1
+
+    def record_miss(self):
+        self._count('misses')
+
+    def _write_blob(self, digest, write):
+        """原子地写入内容文件，已存在时跳过"""
+        blob_path = self._blob_path(digest)
+        if blob_path.exists():
+            return
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=blob_path.parent, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, blob_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _put_entry(self, url, digest, size, headers):
+        now = time.time()
+        entry = CacheEntry(url, digest, size, headers.get('ETag'), headers.get('Last-Modified'),
+                           headers.get('Content-Type'), now)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                entry + (now,)
+            )
+            self._db.commit()
+            self.stats['stored'] += 1
+        return entry
+
+    def store(self, url, content, headers):
+        """保存下载内容，返回对应的缓存条目"""
+        digest = hashlib.sha256(content).hexdigest()
+        self._write_blob(digest, lambda f: f.write(content))
+        return self._put_entry(url, digest, len(content), headers)
+
+    def store_file(self, url, path, digest, size, headers):
+        """保存已流式写入文件的下载内容，digest 为文件的 sha256"""
+        def copy(f):
+            with open(path, 'rb') as src:
+                shutil.copyfileobj(src, f)
+        self._write_blob(digest, copy)
+        return self._put_entry(url, digest, size, headers)
+
+    def evict(self):
+        """删除过期且无法重新验证的条目，再按LRU淘汰到 max_size 以内"""
+        expired_before = time.time() - self.ttl
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT url, digest, size, etag, last_modified, fetched_at FROM entries ORDER BY last_access'
+            ).fetchall()
+            removed = []
+            kept = []
+            for url, digest, size, etag, last_modified, fetched_at in rows:
+                if fetched_at < expired_before and not etag and not last_modified:
+                    removed.append((url, digest))
+                else:
+                    kept.append((url, digest, size))
+
+            total = sum(size for _, _, size in kept)
+            for url, digest, size in kept:
+                if total <= self.max_size:
+                    break
+                removed.append((url, digest))
+                total -= size
+
+            self._db.executemany('DELETE FROM entries WHERE url = ?', [(url,) for url, _ in removed])
+            self._db.commit()
+            self.stats['evicted'] += len(removed)
+
+            # 只删除不再被任何条目引用的内容文件
+            for digest in {digest for _, digest in removed}:
+                in_use = self._db.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+                if not in_use:
+                    try:
+                        self._blob_path(digest).unlink()
+                    except OSError:
+                        pass
+
+        if removed:
+            logger.info(f"缓存淘汰 {len(removed)} 个条目")
+        return len(removed)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            row = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        stats['entries'], stats['size'] = row
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+import mimetypes
+from pathlib import Path
+from datetime import datetime
+from loguru import logger
+
+
+# 资源包格式：文件头 | 内容块... | 压缩的JSON索引 | 文件尾（魔数、索引位置、索引长度）
+PACK_MAGIC = b'LRPACK1\n'
+PACK_FOOTER = struct.Struct('<8sQQ')
+PACK_VERSION = 1
+
+# 值得压缩的内容类型，其余（图片、字体、音视频）大多已经压缩过
+COMPRESSIBLE_TYPES = ('text/', 'javascript', 'json', 'xml', 'svg', 'font/ttf', 'font/otf', 'x-font-ttf', 'ms-fontobject')
+# 压缩后至少要减少的比例，否则保存原始内容
+MIN_COMPRESSION_SAVING = 0.1
+# 从包中读取未压缩内容时每次返回的大小
+READ_CHUNK_SIZE = 1024 * 1024
+# 超过该大小的文件不读入内存压缩，直接分块保存
+MAX_COMPRESS_SIZE = 16 * 1024 * 1024
+
+
+class PackError(ValueError):
+    """资源包格式错误或版本不支持"""
+
+
+def report_path_for(pack_path):
+    """资源包对应的报告文件路径"""
+    return Path(f'{pack_path}.report.json')
+
+
+def _is_compressible(content_type):
+    content_type = (content_type or '').lower()
+    return any(marker in content_type for marker in COMPRESSIBLE_TYPES)
+
+
+class ResourcePackWriter:
+    """把下载的资源写入单个资源包文件
+
+    内容按 sha256 去重，文本类内容用 brotli 压缩；索引为 {url: 位置、长度、原始大小、编码、响应头}，
+    以及下载失败的 {url: 原因}。内容先写入临时文件，close() 时追加索引并原子替换为 path。
+    压缩和写入在锁外进行，锁只用于分配写入位置和更新索引，多个下载线程可以同时写入。
+    """
+
+    def __init__(self, path, brotli_quality=9):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.brotli_quality = brotli_quality
+        self._tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(PACK_MAGIC)
+        self._file.flush()
+        self._lock = threading.Lock()
+        # 下一个内容块的位置
+        self._end = len(PACK_MAGIC)
+        self._blobs = {}
+        self.entries = {}
+        self.missing = {}
+        self.stats = {'entries': 0, 'blobs': 0, 'bytes_in': 0, 'bytes_stored': 0, 'deduplicated': 0}
+
+    def _encode(self, content, content_type):
+        if _is_compressible(content_type):
+            import brotli
+            compressed = brotli.compress(content, quality=self.brotli_quality)
+            if len(compressed) <= len(content) * (1 - MIN_COMPRESSION_SAVING):
+                return compressed, 'br'
+        return content, 'identity'
+
+    def add(self, url, content, content_type=None, final_url=None):
+        """写入一个URL的内容，content_type 为空时按扩展名推断"""
+        content = bytes(content)
+        content_type = content_type or mimetypes.guess_type(url.split('?', 1)[0])[0] or ''
+        digest = hashlib.sha256(content).hexdigest()
+        if self._add_existing(url, digest, len(content), content_type, final_url):
+            return
+        data, encoding = self._encode(content, content_type)
+        offset = self._reserve(len(data))
+        self._write_at(offset, [data])
+        self._add_entry(url, digest, len(content), content_type, final_url, (offset, len(data), encoding))
+
+    def add_file(self, url, path, content_type=None, final_url=None, size=None, digest=None):
+        """写入一个已下载到文件的URL，content_type 为空时按扩展名推断，size 和 digest 已知时直接使用
+
+        不超过 MAX_COMPRESS_SIZE 的文本类内容读入内存压缩，其余内容分块复制，不整个读入内存。
+        """
+        content_type = content_type or mimetypes.guess_type(url.split('?', 1)[0])[0] or ''
+        if size is None:
+            size = os.path.getsize(path)
+        if _is_compressible(content_type) and size <= MAX_COMPRESS_SIZE:
+            with open(path, 'rb') as f:
+                self.add(url, f.read(), content_type, final_url)
+            return
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+        if self._add_existing(url, digest, size, content_type, final_url):
+            return
+        offset = self._reserve(size)
+        with open(path, 'rb') as f:
+            self._write_at(offset, iter(lambda: f.read(READ_CHUNK_SIZE), b''))
+        self._add_entry(url, digest, size, content_type, final_url, (offset, size, 'identity'))
+
+    def _reserve(self, length):
+        """为一个内容块分配位置"""
+        with self._lock:
+            if self._file is None:
+                raise ValueError('资源包已关闭')
+            offset = self._end
+            self._end += length
+        return offset
+
+    def _write_at(self, offset, chunks):
+        """把内容块写入分配的位置，每次写入使用独立的文件句柄"""
+        with open(self._tmp_path, 'r+b') as f:
+            f.seek(offset)
+            for chunk in chunks:
+                f.write(chunk)
+
+    def _add_existing(self, url, digest, size, content_type, final_url):
+        """URL已写入或相同内容已保存时只更新索引，返回True"""
+        with self._lock:
+            if url in self.entries:
+                return True
+            blob = self._blobs.get(digest)
+            if blob is None:
+                return False
+            self.stats['deduplicated'] += 1
+            self._record(url, digest, size, content_type, final_url, blob)
+            return True
+
+    def _add_entry(self, url, digest, size, content_type, final_url, blob):
+        with self._lock:
+            if url in self.entries:
+                return
+            if digest in self._blobs:
+                # 相同内容在另一个线程中同时写入，使用先完成的那份
+                self.stats['deduplicated'] += 1
+                blob = self._blobs[digest]
+            else:
+                self._blobs[digest] = blob
+                self.stats['blobs'] += 1
+                self.stats['bytes_stored'] += blob[1]
+            self._record(url, digest, size, content_type, final_url, blob)
+
+    def _record(self, url, digest, size, content_type, final_url, blob):
+        """登记索引条目，调用时需持有锁"""
+        offset, length, encoding = blob
+        entry = {'offset': offset, 'length': length, 'size': size, 'encoding': encoding, 'sha256': digest}
+        if content_type:
+            entry['headers'] = {'Content-Type': content_type}
+        if final_url and final_url != url:
+            entry['url'] = final_url
+        self.entries[url] = entry
+        self.missing.pop(url, None)
+        self.stats['entries'] += 1
+        self.stats['bytes_in'] += size
+
+    def add_missing(self, url, reason):
+        """记录无法下载的URL，之后下载成功时会被移除"""
+        with self._lock:
+            if url not in self.entries:
+                self.missing[url] = reason
+
+    def close(self):
+        """写入索引和文件尾，生成资源包和报告，返回报告内容"""
+        with self._lock:
+            if self._file is None:
+                return None
+            index = {
+                'version': PACK_VERSION,
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'entries': self.entries,
+                'missing': self.missing
+            }
+            data = zlib.compress(json.dumps(index, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            index_offset = self._end
+            self._file.seek(index_offset)
+            self._file.write(data)
+            self._file.write(PACK_FOOTER.pack(PACK_MAGIC, index_offset, len(data)))
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.path)
+
+        report = {
+            'pack': str(self.path),
+            'created': index['created'],
+            'stats': dict(self.stats, pack_bytes=self.path.stat().st_size),
+            'missing': [{'url': url, 'reason': reason} for url, reason in sorted(self.missing.items())]
+        }
+        report_path = report_path_for(self.path)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"资源包已保存: {self.path}，共 {self.stats['entries']} 个URL，{self.stats['bytes_stored']} 字节")
+        if self.missing:
+            logger.warning(f"资源包缺少 {len(self.missing)} 个URL，详见 {report_path}")
+        return report
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                os.unlink(self._tmp_path)
+
+
+class ResourcePack:
+    """只读打开的资源包，文件通过 mmap 映射，按URL查找是一次字典查询
+
+    未压缩的内容直接从映射区分块读取，不复制整个文件。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < len(PACK_MAGIC) + PACK_FOOTER.size:
+                raise PackError(f"不是有效的资源包: {self.path}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, index_offset, index_length = PACK_FOOTER.unpack_from(self._mmap, size - PACK_FOOTER.size)
+            if self._mmap[:len(PACK_MAGIC)] != PACK_MAGIC or magic != PACK_MAGIC:
+                raise PackError(f"不是有效的资源包: {self.path}")
+            index = json.loads(zlib.decompress(self._mmap[index_offset:index_offset + index_length]))
+            if index.get('version') != PACK_VERSION:
+                raise PackError(f"不支持的资源包版本: {index.get('version')}")
+        except BaseException:
+            self._mmap.close()
+            raise
+        self.created = index.get('created')
+        self.entries = index['entries']
+        self.missing = index.get('missing', {})
+        # 运行时在包中找不到的URL
+        self.misses = {}
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_read': 0}
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, url):
+        """返回URL的索引条目，不在包中时记录并返回None"""
+        entry = self.entries.get(url)
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                self.misses[url] = self.missing.get(url, 'not_in_pack')
+            else:
+                self.stats['hits'] += 1
+                self.stats['bytes_read'] += entry['size']
+        return entry
+
+    def iter_chunks(self, entry):
+        """逐块返回条目的原始内容"""
+        start = entry['offset']
+        end = start + entry['length']
+        if entry['encoding'] == 'br':
+            import brotli
+            yield brotli.decompress(self._mmap[start:end])
+            return
+        with memoryview(self._mmap) as view:
+            for offset in range(start, end, READ_CHUNK_SIZE):
+                yield bytes(view[offset:min(end, offset + READ_CHUNK_SIZE)])
+
+    def read(self, entry):
+        return b''.join(self.iter_chunks(entry))
+
+    def content_type(self, entry):
+        return (entry.get('headers') or {}).get('Content-Type')
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            misses = dict(self.misses)
+        stats.update(path=str(self.path), entries=len(self.entries), missing=misses)
+        return stats
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='导出或查看离线资源包')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='扫描目录，下载其中引用的所有外部资源并写入资源包')
+    export.add_argument('base_dir', help='要扫描的目录')
+    export.add_argument('pack', help='输出的资源包文件')
+    export.add_argument('--proxy', default=None, help='代理，格式为 ip:port')
+    export.add_argument('--output', default=None, help='同时生成的本地化输出目录')
+    export.add_argument('--workers', type=int, default=8, help='并发下载线程数')
+    export.add_argument('--cache-dir', default=None, help='持久化缓存目录')
+    info = subparsers.add_parser('info', help='查看资源包的内容和缺少的URL')
+    info.add_argument('pack', help='资源包文件')
+    info.add_argument('--list', action='store_true', help='列出包中的全部URL')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'info':
+        with ResourcePack(args.pack) as pack:
+            stored = sum(entry['length'] for entry in pack.entries.values())
+            print(f"{pack.path}: {len(pack)} 个URL，内容 {stored} 字节，创建于 {pack.created}")
+            if args.list:
+                for url, entry in sorted(pack.entries.items()):
+                    print(f"  {entry['size']:>10}  {entry['encoding']:<8}  {url}")
+            if pack.missing:
+                print(f"缺少 {len(pack.missing)} 个URL:")
+                for url, reason in sorted(pack.missing.items()):
+                    print(f"  [{reason}] {url}")
+        return 1 if pack.missing else 0
+
+    from localize_resources import ResourceLocalizer
+    localizer = ResourceLocalizer(args.base_dir, args.proxy, max_workers=args.workers, output_dir=args.output,
+                                  cache_dir=args.cache_dir, export_pack=args.pack)
+    localizer.process_directory()
+    return 1 if localizer.pack_writer.missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
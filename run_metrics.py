@@ -0,0 +1,253 @@
+import re
+import json
+import time
+import bisect
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from output_writer import write_atomic
+
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """按固定桶统计的延迟分布，桶计数不累加，导出 Prometheus 格式时再累加"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': dict(zip(bounds, self.counts))
+        }
+
+
+class RunMetrics:
+    """一次运行的计时和计数
+
+    phase() 统计各阶段的独占时间：阶段中嵌套的子阶段耗时只计入子阶段，
+    不同线程分别计时，因此各阶段之和可能超过墙钟时间。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started_at = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.histograms = {}
+        self.host_failures = {}
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def phase(self, name):
+        """统计代码块的耗时，同时把每次调用的耗时记入同名直方图"""
+        stack = self._stack()
+        frame = [name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            if stack:
+                stack[-1][2] += elapsed
+            with self._lock:
+                phase = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                phase['seconds'] += elapsed - frame[2]
+                phase['calls'] += 1
+                self._observe(name, elapsed)
+
+    def _observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def observe(self, name, value):
+        """记录一次延迟"""
+        with self._lock:
+            self._observe(name, value)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_failure(self, host, reason):
+        """按主机记录下载失败，reason 为HTTP状态码或异常类型"""
+        with self._lock:
+            failures = self.host_failures.setdefault(host or '', {})
+            failures[reason] = failures.get(reason, 0) + 1
+            self.counters['failures'] = self.counters.get('failures', 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'elapsed_seconds': round(time.time() - self.started_at, 6),
+                'phases': {
+                    name: {'seconds': round(phase['seconds'], 6), 'calls': phase['calls']}
+                    for name, phase in sorted(self.phases.items())
+                },
+                'counters': dict(sorted(self.counters.items())),
+                'host_failures': {host: dict(reasons) for host, reasons in sorted(self.host_failures.items())},
+                'histograms': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+            }
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(report, prefix='localize'):
+    """把运行报告转换为 Prometheus 文本格式"""
+    lines = []
+    metrics = report['metrics']
+
+    lines.append(f'# TYPE {prefix}_run_seconds gauge')
+    lines.append(f"{prefix}_run_seconds {metrics['elapsed_seconds']}")
+    lines.append(f'# TYPE {prefix}_phase_seconds gauge')
+    for name, phase in metrics['phases'].items():
+        lines.append(f'{prefix}_phase_seconds{{phase="{_label_value(name)}"}} {phase["seconds"]}')
+    lines.append(f'# TYPE {prefix}_phase_calls gauge')
+    for name, phase in metrics['phases'].items():
+        lines.append(f'{prefix}_phase_calls{{phase="{_label_value(name)}"}} {phase["calls"]}')
+    for name, value in metrics['counters'].items():
+        metric = f'{prefix}_{_metric_name(name)}'
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {value}')
+    lines.append(f'# TYPE {prefix}_host_failures gauge')
+    for host, reasons in metrics['host_failures'].items():
+        for reason, value in reasons.items():
+            lines.append(f'{prefix}_host_failures{{host="{_label_value(host)}",reason="{_label_value(reason)}"}} {value}')
+    for name, histogram in metrics['histograms'].items():
+        metric = f'{prefix}_{_metric_name(name)}_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        cumulative = 0
+        for bound, value in histogram['buckets'].items():
+            cumulative += value
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum {histogram["sum"]}')
+        lines.append(f'{metric}_count {histogram["count"]}')
+
+    for section in ('cache', 'content_store', 'mirror', 'writer', 'postprocess', 'pack'):
+        for name, value in (report.get(section) or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = f'{prefix}_{section}_{_metric_name(name)}'
+                lines.append(f'# TYPE {metric} gauge')
+                lines.append(f'{metric} {value}')
+    host_stats = (report.get('hosts') or {}).get('hosts') or {}
+    for name in ('requests', 'successes', 'failures', 'retries', 'rejected', 'circuit_opened', 'rate_limited', 'rate_limit_wait'):
+        metric = f'{prefix}_host_{name}'
+        lines.append(f'# TYPE {metric} gauge')
+        for host, stats in host_stats.items():
+            lines.append(f'{metric}{{host="{_label_value(host)}"}} {stats[name]}')
+    connections = report.get('connections') or {}
+    for name in ('requests', 'connections', 'reused'):
+        if name in connections:
+            lines.append(f'# TYPE {prefix}_http_{name} gauge')
+            lines.append(f'{prefix}_http_{name} {connections[name]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_text(path, text):
+    """原子写入文本，读取方不会看到写了一半的文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = text.encode('utf-8')
+    write_atomic(path, lambda f: f.write(data))
+
+
+def write_json_report(path, report):
+    _write_text(path, json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def write_prometheus_textfile(path, report, prefix='localize'):
+    """写出 node_exporter textfile collector 可读取的 .prom 文件"""
+    _write_text(path, to_prometheus(report, prefix))
+
+
+class RunProfiler:
+    """为一次运行挂载 cProfile 和/或 tracemalloc
+
+    cProfile 只统计调用 start() 的线程，结果保存到 profile_path，可用 pstats 或 snakeviz 查看；
+    trace_memory 为 True 时记录内存峰值和分配最多的 top 个位置。
+    """
+
+    def __init__(self, profile_path=None, trace_memory=False, top=20):
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.top = top
+        self._profile = None
+        self._started_tracemalloc = False
+        self.memory = None
+
+    def start(self):
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+        if self.profile_path:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+            Path(self.profile_path).parent.mkdir(parents=True, exist_ok=True)
+            self._profile.dump_stats(str(self.profile_path))
+            self._profile = None
+        if self.trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                self.memory = {
+                    'current_bytes': current,
+                    'peak_bytes': peak,
+                    'top': [
+                        {'location': str(stat.traceback[0]), 'bytes': stat.size, 'blocks': stat.count}
+                        for stat in snapshot.statistics('lineno')[:self.top]
+                    ]
+                }
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+
+    def to_dict(self):
+        report = {}
+        if self.profile_path:
+            report['profile_path'] = str(self.profile_path)
+        if self.memory is not None:
+            report['memory'] = self.memory
+        return report
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()